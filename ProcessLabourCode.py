@@ -1,7 +1,8 @@
-import pdfplumber
 import re
 import csv
 
+from services.pdf_extraction import extract_text
+
 # ---------------------------
 # CONFIG
 # ---------------------------
@@ -15,13 +16,8 @@ CHUNK_SIZE = 800   # target chunk size in words (500–1000 window)
 # STEP 1: Extract text from PDF
 # ---------------------------
 def extract_text_from_pdf(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    return text
+    # pages are extracted in parallel and cached per (PDF hash, page)
+    return extract_text(pdf_path)
 
 # ---------------------------
 # STEP 2: Clean the text
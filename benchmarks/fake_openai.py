@@ -0,0 +1,140 @@
+# benchmarks/fake_openai.py
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ----------------------------
+# Local stand-in for the OpenAI endpoints the backend uses
+# ----------------------------
+# embeddings, responses (plain and streamed) and chat completions, with injected latency.
+# Answers cite the first source id found in the instructions, so the source extraction
+# of the routes is exercised as well.
+
+MODEL_DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072}
+UUID_PATTERN_LENGTH = 36
+ANSWER_WORDS = ("Zaměstnanec", "má", "nárok", "na", "dovolenou", "podle", "zákoníku", "práce", "v", "rozsahu",
+                "čtyř", "týdnů", "za", "kalendářní", "rok", "a", "zaměstnavatel", "ji", "určí", "písemně.")
+
+
+def jittered(ms):
+    """Latency around `ms` with a long right tail (lognormal, median = ms)."""
+    return max(ms, 0) / 1000.0 * random.lognormvariate(0, 0.35) if ms > 0 else 0.0
+
+
+def fake_embedding(model, text):
+    """Deterministic unit vector per (model, text), so repeated texts embed identically."""
+    seed = int.from_bytes(hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(MODEL_DIMENSIONS.get(model, 1536)).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+def cited_id(instructions):
+    """First source id of the prompt sources (build_context JSON), if any."""
+    index = (instructions or "").find('"id":"')
+    if index == -1:
+        return None
+    return instructions[index + 6:index + 6 + UUID_PATTERN_LENGTH]
+
+
+def answer_tokens(count, source_id, sentinel=""):
+    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+    if source_id:
+        words.append(f"\n{sentinel}[{source_id}]")
+    return words
+
+
+def response_object(model, text, input_tokens):
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [{
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "usage": {"input_tokens": input_tokens, "output_tokens": len(text.split()), "total_tokens": input_tokens + len(text.split())},
+    }
+
+
+def create_app(embedding_ms=80, ttft_ms=400, token_interval_ms=25, answer_tokens_count=80, completion_ms=1500):
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(jittered(embedding_ms))
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(body["model"], text)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(len(t) // 4 + 1 for t in inputs), "total_tokens": sum(len(t) // 4 + 1 for t in inputs)},
+        }
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        body = await request.json()
+        instructions = body.get("instructions") or ""
+        input_tokens = len(instructions) // 4 + 1
+        source_id = cited_id(instructions)
+
+        if not body.get("stream"):
+            # expansion requests (gpt-4.1-nano) are short, answers take the full completion time
+            if "nano" in body["model"]:
+                await asyncio.sleep(jittered(ttft_ms))
+                return response_object(body["model"], "pracovní doba dovolená zákoník práce", input_tokens)
+            await asyncio.sleep(jittered(completion_ms))
+            return response_object(body["model"], "".join(answer_tokens(answer_tokens_count, source_id)), input_tokens)
+
+        async def events():
+            await asyncio.sleep(jittered(ttft_ms))
+            tokens = answer_tokens(answer_tokens_count, source_id, sentinel="$")
+            item_id = f"msg_{uuid.uuid4().hex}"
+            for sequence, token in enumerate(tokens):
+                event = {"type": "response.output_text.delta", "item_id": item_id, "output_index": 0,
+                         "content_index": 0, "delta": token, "logprobs": [], "sequence_number": sequence}
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                await asyncio.sleep(jittered(token_interval_ms))
+            event = {"type": "response.completed", "sequence_number": len(tokens),
+                     "response": response_object(body["model"], "".join(tokens), input_tokens)}
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(jittered(completion_ms))
+        text = "".join(answer_tokens(answer_tokens_count, None))
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // 4 + 1
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": answer_tokens_count,
+                      "total_tokens": prompt_tokens + answer_tokens_count},
+        })
+
+    @app.get("/v1/models")
+    async def models():
+        # used by the startup warm-up (WARMUP=1) to open the connection pool
+        return {"object": "list", "data": [{"id": m, "object": "model", "created": 0, "owned_by": "system"}
+                                           for m in ("gpt-4.1", "gpt-4.1-nano", "text-embedding-3-small", "text-embedding-3-large")]}
+
+    return app
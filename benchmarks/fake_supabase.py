@@ -0,0 +1,97 @@
+# benchmarks/fake_supabase.py
+
+import asyncio
+import json
+import random
+import uuid
+
+from fastapi import FastAPI, Request, Response
+
+from benchmarks.fake_openai import fake_embedding, jittered
+
+# ----------------------------
+# Local stand-in for the Supabase PostgREST API
+# ----------------------------
+# match_documents / match_knowledge_base RPCs plus the table reads the API does at startup
+# and for the answer cache fingerprint, over a generated labour-law-like corpus.
+
+CORPUS_NAMESPACE = uuid.UUID("0b7c2a91-5d0e-4a7e-8f3c-6a1d9e2b4c55")
+TOPICS = ("pracovní doba", "dovolená", "mzda", "výpověď", "odstupné", "pracovní poměr", "zkušební doba",
+          "přesčas", "práce na dálku", "dohoda o provedení práce", "bezpečnost práce", "mateřská dovolená")
+TABLE_MODELS = {"documents": "text-embedding-3-small", "knowledge_base": "text-embedding-3-large"}
+
+
+def build_corpus(size):
+    documents = []
+    for i in range(size):
+        topic = TOPICS[i % len(TOPICS)]
+        section = 30 + i
+        content = (f"§ {section} Zaměstnavatel a zaměstnanec ({topic}). (1) Ustanovení o {topic} se vztahuje "
+                   f"na všechny zaměstnance v pracovním poměru. (2) Podrobnosti stanoví § {section + 1} odst. 2 "
+                   f"písm. a) a vnitřní předpis zaměstnavatele. ") * 4
+        documents.append({
+            "id": str(uuid.uuid5(CORPUS_NAMESPACE, f"documents/{i}")),
+            "title": f"§ {section} {topic}",
+            "content": content,
+            "tags": {"structural": [f"§ {section}"], "semantic": [topic]},
+            "method": "structure",
+            "source_file": "zakonik_prace.pdf",
+            "version": "v1",
+        })
+    knowledge_base = [
+        {"id": d["id"], "title": d["title"], "chunk_text": d["content"], "tags": d["tags"]["semantic"], "source_ref": "labour_code"}
+        for d in documents
+    ]
+    return {"documents": documents, "knowledge_base": knowledge_base}
+
+
+def match_rows(rows, count, best=0.62, step=0.03):
+    """`count` random rows with similarities decreasing from `best`, like a vector search result."""
+    picked = random.sample(rows, min(count, len(rows)))
+    return [{**row, "similarity": round(best - i * step * random.uniform(0.5, 1.5), 4)} for i, row in enumerate(picked)]
+
+
+def create_app(rpc_ms=40, read_ms=15, corpus_size=500):
+    app = FastAPI(title="Fake Supabase")
+    tables = build_corpus(corpus_size)
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(jittered(rpc_ms))
+        table = "documents" if function == "match_documents" else "knowledge_base"
+        return match_rows(tables[table], int(body.get("match_count") or 10))
+
+    @app.get("/rest/v1/{table}")
+    async def read(table: str, request: Request):
+        await asyncio.sleep(jittered(read_ms))
+        params = request.query_params
+        rows = tables.get(table, [])
+
+        for column, condition in params.items():
+            if condition.startswith("in.("):
+                wanted = set(condition[4:-1].split(","))
+                rows = [r for r in rows if str(r.get(column)) in wanted]
+            elif condition == "not.is.null":
+                rows = [r for r in rows if r.get(column) is not None]
+        order = params.get("order")
+        if order:
+            column, _, direction = order.partition(".")
+            rows = sorted(rows, key=lambda r: str(r.get(column)), reverse=direction.startswith("desc"))
+
+        total = len(rows)
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", total))
+        rows = rows[offset:offset + limit]
+
+        columns = [c.strip() for c in params.get("select", "*").split(",")]
+        if columns != ["*"]:
+            rows = [
+                {c: json.dumps(fake_embedding(TABLE_MODELS[table], r["id"])) if c == "embedding" else r.get(c) for c in columns}
+                for r in rows
+            ]
+        end = offset + len(rows) - 1 if rows else offset
+        return Response(json.dumps(rows, ensure_ascii=False), media_type="application/json",
+                        headers={"Content-Range": f"{offset}-{end}/{total}"})
+
+    return app
@@ -0,0 +1,195 @@
+# benchmarks/run.py
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import httpx
+import uvicorn
+
+from benchmarks import fake_openai, fake_supabase
+
+# ----------------------------
+# Offline load test of the FastAPI app against local OpenAI / Supabase stand-ins
+# ----------------------------
+# python -m benchmarks.run --endpoints query,stream --concurrency 16 --requests 200 --save baseline
+# python -m benchmarks.run --endpoints query,stream --concurrency 16 --requests 200 --compare baseline
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+QUESTIONS = (
+    "Kolik dní dovolené mi náleží za rok?",
+    "Jak dlouhá může být zkušební doba?",
+    "Kdy mi zaměstnavatel musí vyplatit mzdu?",
+    "Jaká je výpovědní doba při výpovědi ze strany zaměstnance?",
+    "How many hours of overtime can an employer order per year?",
+    "Do I get severance pay when my position is cancelled?",
+    "Může mi zaměstnavatel nařídit práci na dálku?",
+    "What are the rules for a work performance agreement?",
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port):
+    """Runs `app` with uvicorn in a daemon thread, returns once it accepts connections."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(samples, elapsed):
+    latencies = [s["latency"] for s in samples if not s["error"]]
+    ttfts = [s["ttft"] for s in samples if s.get("ttft") is not None]
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s["error"]),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+    }
+    for p in (50, 95, 99):
+        summary[f"p{p}_ms"] = percentile(latencies, p) * 1000 if latencies else None
+        if ttfts:
+            summary[f"ttft_p{p}_ms"] = percentile(ttfts, p) * 1000
+    return summary
+
+
+async def call(client, endpoint, question):
+    started = time.perf_counter()
+    ttft, error = None, False
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/stream", json={"question": question}) as response:
+                async for line in response.aiter_lines():
+                    if ttft is None and line.startswith('data: {"content"'):
+                        ttft = time.perf_counter() - started
+                    if line.startswith('data: {"error"'):
+                        error = True
+                error = error or response.status_code != 200
+        else:
+            response = await client.post(f"/{endpoint}", json={"question": question})
+            error = response.status_code != 200
+    except httpx.HTTPError:
+        error = True
+    return {"latency": time.perf_counter() - started, "ttft": ttft, "error": error}
+
+
+async def drive(base_url, endpoint, requests, concurrency, question_pool):
+    """Sends `requests` requests to `endpoint`, at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def one(i):
+            # unique questions measure the full pipeline, a small pool measures the cached path
+            question = QUESTIONS[i % len(QUESTIONS)]
+            question = f"{question} ({i % question_pool})" if question_pool else f"{question} (#{i})"
+            async with semaphore:
+                return await call(client, endpoint, question)
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(i) for i in range(requests)))
+        return summarize(samples, time.perf_counter() - started)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_report(results, baseline=None):
+    columns = ("rps", "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms", "ttft_p99_ms")
+    print(f"\n{'endpoint':<8} {'reqs':>5} {'errs':>5} " + " ".join(f"{c:>12}" for c in columns))
+    for endpoint, summary in results.items():
+        cells = []
+        for column in columns:
+            value = summary.get(column)
+            cell = "-" if value is None else f"{value:.1f}"
+            before = (baseline or {}).get(endpoint, {}).get(column)
+            if value is not None and before:
+                cell += f" ({(value - before) / before * 100:+.0f}%)"
+            cells.append(f"{cell:>12}")
+        print(f"{endpoint:<8} {summary['requests']:>5} {summary['errors']:>5} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of /query, /ask and /stream")
+    parser.add_argument("--endpoints", default="query,ask,stream")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--question-pool", type=int, default=0, help="distinct questions (0 = every request unique)")
+    parser.add_argument("--embedding-ms", type=float, default=80)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--token-interval-ms", type=float, default=25)
+    parser.add_argument("--answer-tokens", type=int, default=80)
+    parser.add_argument("--completion-ms", type=float, default=1500)
+    parser.add_argument("--rpc-ms", type=float, default=40)
+    parser.add_argument("--corpus-size", type=int, default=500)
+    parser.add_argument("--save", metavar="NAME", help="save the results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="compare against baseline NAME")
+    args = parser.parse_args()
+
+    openai_port, supabase_port, app_port = free_port(), free_port(), free_port()
+    serve(fake_openai.create_app(args.embedding_ms, args.ttft_ms, args.token_interval_ms, args.answer_tokens,
+                                 args.completion_ms), openai_port)
+    serve(fake_supabase.create_app(args.rpc_ms, corpus_size=args.corpus_size), supabase_port)
+
+    # the app reads its configuration at import time: point it at the stand-ins, with fresh caches
+    state_dir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "SUPABASE_URL": f"http://127.0.0.1:{supabase_port}",
+        "SUPABASE_KEY": "benchmark.benchmark.benchmark",
+        "EMBEDDING_CACHE_PATH": os.path.join(state_dir, "embeddings.sqlite3"),
+        "CITATION_INDEX_PATH": os.path.join(state_dir, "citation_index.json"),
+        "LEXICAL_INDEX_PATH": os.path.join(state_dir, "lexical_index.json"),
+        "LOCAL_INDEX_DIR": os.path.join(state_dir, "local_index"),
+        "LOG_SAMPLE_RATE": os.environ.get("LOG_SAMPLE_RATE", "0"),
+    })
+    import main as backend
+    serve(backend.app, app_port)
+
+    results = {}
+    for endpoint in args.endpoints.split(","):
+        print(f"🏁 {endpoint}: {args.requests} requests, concurrency {args.concurrency}")
+        results[endpoint] = asyncio.run(drive(f"http://127.0.0.1:{app_port}", endpoint, args.requests,
+                                              args.concurrency, args.question_pool))
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"), "revision": git_revision(),
+                       "config": vars(args), "results": results}, f, indent=2)
+        print(f"💾 Baseline saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,49 @@
 print("🚀 Running NEW embedding_to_supabase.py from:", __file__)
 
+import asyncio
 import os
 import re
 import uuid
 import csv
-import pdfplumber
+import json
+import time
+import hashlib
 from datetime import datetime
 from dotenv import load_dotenv
-import concurrent.futures
-from openai import OpenAI
+
+# the shared clients read their credentials on import
+load_dotenv()
 
 # Local services
-from services.embeddings import get_embedding
-from services.supabase_client import supabase
+from services.citation_index import citation_index
+from services.clients import clients
+from services.lexical_index import lexical_index
+from services.embedding_cache import normalize_text
+from services.embeddings import estimate_tokens, get_embeddings_sync
+from services.llm_scheduler import llm_scheduler
+from services.pdf_extraction import extract_text
+from services.supabase_client import SupabaseData
 
 # ----------------------------
 # Setup
 # ----------------------------
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# documents table stores 1536-d vectors, same model /stream queries it with
+DOCUMENTS_EMBEDDING_MODEL = "text-embedding-3-small"
+INSERT_BATCH_SIZE = 100  # rows per bulk upsert
+
+# Namespace for content-addressed chunk ids (uuid5), never change it or every chunk gets a new id
+CHUNK_ID_NAMESPACE = uuid.UUID("5b0c3f7e-2f4a-4e8e-9a57-0d6f3c1b8e21")
+
+# ----------------------------
+# Content addressing
+# ----------------------------
+def content_hash(content):
+    """Stable hash of the normalized chunk content."""
+    return hashlib.sha256(normalize_text(content).encode("utf-8")).hexdigest()
+
+def chunk_id(document_key, content):
+    """Same content in the same document always gets the same id, across runs, versions and file names."""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{document_key}:{content_hash(content)}"))
 
 # ----------------------------
 # GPT Prompt Templates
@@ -51,16 +76,21 @@ Chunk:
 # ----------------------------
 # GPT Helpers
 # ----------------------------
+COMPLETION_TOKENS_ESTIMATE = 1500  # reserved from the token budget for the answer of each chat call
+
 def call_gpt_with_timeout(prompt, timeout=90):
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(
-            lambda: client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-        )
-        return future.result(timeout=timeout).choices[0].message.content
+    """Chat call through the shared scheduler; the timeout aborts the HTTP request itself."""
+    completion = llm_scheduler.run(
+        lambda t: clients.sync_openai.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            timeout=t,
+        ),
+        tokens=estimate_tokens(prompt) + COMPLETION_TOKENS_ESTIMATE,
+        timeout=timeout,
+    )
+    return completion.choices[0].message.content
 
 def chunk_text(block):
     prompt = CHUNK_PROMPT.format(block=block)
@@ -182,7 +212,9 @@ Text:
 # ----------------------------
 # Chunking Methods
 # ----------------------------
-def chunk_structure(text):
+def chunk_structure(text, known_tags=None):
+    """`known_tags` maps content_hash → tags of chunks already stored, those are not re-tagged."""
+    known_tags = known_tags or {}
     paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
     chunks = []
     current_chunk, current_len = [], 0
@@ -200,43 +232,47 @@ def chunk_structure(text):
     if current_chunk:
         chunks.append(" ".join(current_chunk))
 
+    # tag all new chunks in parallel through the shared scheduler
+    untagged = [c for c in chunks if content_hash(c) not in known_tags]
+    gpt_tags = dict(zip(untagged, llm_scheduler.map(lambda c: gpt_generate_tags(c, max_semantic=5), untagged)))
+
     chunk_dicts = []
     for c in chunks:
-        regex_tags = extract_regex_tags(c)
-        gpt_structural, gpt_semantic = gpt_generate_tags(c, max_semantic=5)
+        tags = known_tags.get(content_hash(c))
+        if tags is None:
+            gpt_structural, gpt_semantic = gpt_tags[c]
+            tags = {
+                "structural": extract_regex_tags(c) + gpt_structural,
+                "semantic": gpt_semantic
+            }
         chunk_dicts.append({
             "title": "General",
-            "tags": {
-                "structural": regex_tags + gpt_structural,
-                "semantic": gpt_semantic
-            },
+            "tags": tags,
             "content": c
         })
     return chunk_dicts
 
 def chunk_meaning(text):
     blocks = [text[i:i+5000] for i in range(0, len(text), 5000)]
-    all_chunks = []
-    for block in blocks:
-        chunked = parse_chunks(chunk_text(block))
-        repaired_chunks = []
-        for ch in chunked:
-            if not is_valid_chunk(ch):
-                repaired = repair_chunk(
-                    ch["content"],
-                    feedback=f"Chunk had {len(ch['content'].split())} words. Adjust to 625–850."
-                )
-                new_chunks = parse_chunks(repaired)
-                if new_chunks and is_valid_chunk(new_chunks[0]):
-                    repaired_chunks.append(new_chunks[0])
-                else:
-                    repaired_chunks.append(ch)
-            else:
-                repaired_chunks.append(ch)
-        all_chunks.extend(repaired_chunks)
+
+    # chunk all blocks in parallel, then repair all invalid chunks in parallel
+    all_chunks = [ch for output in llm_scheduler.map(chunk_text, blocks) for ch in parse_chunks(output)]
+    invalid = [i for i, ch in enumerate(all_chunks) if not is_valid_chunk(ch)]
+
+    def repair(ch):
+        return parse_chunks(repair_chunk(
+            ch["content"],
+            feedback=f"Chunk had {len(ch['content'].split())} words. Adjust to 625–850."
+        ))
+
+    for i, new_chunks in zip(invalid, llm_scheduler.map(repair, [all_chunks[i] for i in invalid])):
+        if new_chunks and is_valid_chunk(new_chunks[0]):
+            all_chunks[i] = new_chunks[0]
     return all_chunks
 
-def chunk_fixed(text, chunk_size=650, overlap=150, max_semantic=5):
+def chunk_fixed(text, chunk_size=650, overlap=150, max_semantic=5, known_tags=None):
+    """`known_tags` maps content_hash → tags of chunks already stored, those are not re-tagged."""
+    known_tags = known_tags or {}
     words = text.split()
     chunks = []
     step = chunk_size - overlap
@@ -244,33 +280,46 @@ def chunk_fixed(text, chunk_size=650, overlap=150, max_semantic=5):
         chunk = words[i:i+chunk_size]
         if not chunk:
             break
-        content = " ".join(chunk)
-        _, gpt_semantic = gpt_generate_tags(content, max_semantic=max_semantic)
         chunks.append({
             "title": f"Chunk {i+1}",
-            "tags": {"structural": [], "semantic": gpt_semantic},
-            "content": content
+            "tags": {"structural": [], "semantic": []},
+            "content": " ".join(chunk)
         })
+
+    # tag all new chunks in parallel through the shared scheduler
+    untagged = []
+    for ch in chunks:
+        tags = known_tags.get(content_hash(ch["content"]))
+        if tags is None:
+            untagged.append(ch)
+        else:
+            ch["tags"] = tags
+    gpt_tags = llm_scheduler.map(lambda ch: gpt_generate_tags(ch["content"], max_semantic=max_semantic), untagged)
+    for ch, (_, gpt_semantic) in zip(untagged, gpt_tags):
+        ch["tags"]["semantic"] = gpt_semantic
     return chunks
 
 # ----------------------------
 # Main ingestion function
 # ----------------------------
-def ingest_file(file_path: str, force_method: str = None, version: str = None):
+def ingest_file(file_path: str, force_method: str = None, version: str = None, document_key: str = None):
+    """
+    `document_key` identifies the document across versions (default: the file name). New consolidated
+    versions usually arrive under a new file name ("..._June2025.pdf"): pass the key of the previous
+    version (for documents ingested before keys existed, their original file name) so unchanged chunks
+    keep their ids, tags and embeddings and the previous version's chunks are retired.
+    `source_file` is only stored as metadata. Needs `alter table documents add column document_key text`.
+    """
     if version is None:
         version = input("Enter version number for this document (press Enter to skip): ").strip()
         if version == "":
             version = None
 
     filename = os.path.basename(file_path)
+    document_key = document_key or filename
 
-    text = ""
     if file_path.lower().endswith(".pdf"):
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        text = extract_text(file_path)
     else:
         with open(file_path, "r", encoding="utf-8") as f:
             text = f.read()
@@ -278,12 +327,20 @@ def ingest_file(file_path: str, force_method: str = None, version: str = None):
     method = force_method or detect_method(text, filename)
     print(f"📄 File: {filename} → Method: {method}")
 
+    # Chunks already stored for this file: unchanged content keeps its id, tags and embedding
+    existing = fetch_existing_chunks(document_key)
+    existing_by_id = {r["id"]: r for r in existing}
+    existing_by_hash = {content_hash(r["content"]): r for r in existing}
+    known_tags = {h: r["tags"] for h, r in existing_by_hash.items()}
+    if existing:
+        print(f"♻️ Found {len(existing)} stored chunks of {document_key}, only new/changed chunks will be tagged and embedded")
+
     if method == "structure":
-        chunks = chunk_structure(text)
+        chunks = chunk_structure(text, known_tags=known_tags)
     elif method == "meaning":
         chunks = chunk_meaning(text)
     else:
-        chunks = chunk_fixed(text)
+        chunks = chunk_fixed(text, known_tags=known_tags)
 
     print(f"✂️ Created {len(chunks)} chunks.")
 
@@ -293,31 +350,147 @@ def ingest_file(file_path: str, force_method: str = None, version: str = None):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     csv_file = os.path.join(csv_dir, f"{os.path.splitext(filename)[0]}_{method}_{timestamp}.csv")
 
+    rows = {}
+    for idx, ch in enumerate(chunks, 1):
+        row_id = chunk_id(document_key, ch["content"])
+        if row_id in rows:
+            continue  # identical chunk twice in the same document
+        rows[row_id] = {
+            "id": row_id,
+            "title": ch.get("title") or f"{filename} - chunk {idx}",
+            "content": ch["content"],
+            "tags": ch["tags"],
+            "method": method,
+            "source_file": filename,
+            "document_key": document_key,
+            "version": version
+        }
+    rows = list(rows.values())
+
+    added = [r for r in rows if r["id"] not in existing_by_id]
+    unchanged = [r for r in rows if r["id"] in existing_by_id]
+    retired = [row_id for row_id in existing_by_id if row_id not in {r["id"] for r in rows}]
+
+    # rows stored before content addressing (random ids) with identical content: reuse their embedding
+    legacy = {}
+    for r in added:
+        match = existing_by_hash.get(content_hash(r["content"]))
+        if match:
+            legacy[r["id"]] = match["id"]
+    stored_embeddings = fetch_embeddings(list(legacy.values()))
+
+    # Embed new chunks in batches: one multi-input embeddings call per batch
+    started = time.perf_counter()
+    embedded = 0
+
+    def embed_batch(batch):
+        nonlocal embedded
+        to_embed = [r for r in batch if legacy.get(r["id"]) not in stored_embeddings]
+        fresh = dict(zip(
+            (r["id"] for r in to_embed),
+            get_embeddings_sync([r["content"] for r in to_embed], model=DOCUMENTS_EMBEDDING_MODEL)
+        ))
+        embedded += len(to_embed)
+        return [{**r, "embedding": fresh.get(r["id"]) or stored_embeddings[legacy[r["id"]]]} for r in batch]
+
+    # Unchanged chunks only move to the new version, chunks that disappeared from the document are retired
+    bump = [r["id"] for r in unchanged if existing_by_id[r["id"]].get("version") != version]
+    asyncio.run(write_changes(added, embed_batch, bump, retired, version))
+
+    # § reference index: replace this file's chunks with the current version
+    citation_index.load()
+    citation_index.remove_document(document_key)
+    citation_index.add_rows(rows)
+    citation_index.save()
+    print(f"📑 Citation index updated: {len(citation_index.keys)} references")
+
+    # BM25 lexical index (HYBRID_RETRIEVAL): same replacement
+    lexical_index.load()
+    lexical_index.remove_document(document_key)
+    lexical_index.add_rows(rows)
+    lexical_index.save()
+    print(f"📑 Lexical index updated: {len(lexical_index.postings)} terms over {len(lexical_index)} chunks")
+
     with open(csv_file, "w", encoding="utf-8", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["id", "title", "content", "tags", "method", "source_file", "version"])
-        for idx, ch in enumerate(chunks, 1):
-            chunk_id = str(uuid.uuid4())
-            title = ch.get("title") or f"{filename} - chunk {idx}"
-            content = ch["content"]
-            tags = ch["tags"]
-
-            embedding = get_embedding(content)
-            supabase.table("documents").insert({
-                "id": chunk_id,
-                "title": title,
-                "content": content,
-                "tags": tags,
-                "method": method,
-                "source_file": filename,
-                "embedding": embedding,
-                "version": version
-            }).execute()
-
-            writer.writerow([chunk_id, title, content, tags, method, filename, version])
-
-    print(f"✅ Inserted {len(chunks)} chunks into Supabase")
+        for r in rows:
+            writer.writerow([r["id"], r["title"], r["content"], r["tags"], method, filename, version])
+
+    elapsed = time.perf_counter() - started
+    if added:
+        print(f"⏱️ Embedding + upload: {elapsed:.1f}s, {len(added) / elapsed:.1f} chunks/s, "
+              f"{sum(len(r['content'].split()) for r in added) / elapsed:.0f} words/s")
+
+    # Diff report for this version
+    report = {
+        "source_file": filename,
+        "document_key": document_key,
+        "version": version,
+        "previous_versions": sorted({str(r.get("version")) for r in existing}),
+        "method": method,
+        "added": [r["id"] for r in added],
+        "unchanged": [r["id"] for r in unchanged],
+        "retired": retired,
+        "embedded": embedded,
+        "reused_embeddings": len(unchanged) + len(added) - embedded,
+    }
+    report_file = os.path.join(csv_dir, f"{os.path.splitext(filename)[0]}_{version or 'unversioned'}_diff_{timestamp}.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Version {version}: +{len(added)} new, ={len(unchanged)} unchanged, -{len(retired)} retired "
+          f"({embedded} embedded, {report['reused_embeddings']} embeddings reused)")
     print(f"📂 CSV saved: {csv_file}")
+    print(f"📂 Diff report saved: {report_file}")
+
+async def write_changes(added, embed_batch, bump, retired, version):
+    """
+    Writes of one ingest through the async data-access layer, in an order that never leaves a document
+    without chunks: new chunks are embedded and upserted batch by batch, then unchanged chunks move to
+    the new version, and retired chunks are deleted only after both succeeded. A failed write raises
+    before the deletes, the old version stays searchable and a re-run picks up where this one stopped.
+    """
+    started = time.perf_counter()
+    async with SupabaseData() as db:
+        for start in range(0, len(added), INSERT_BATCH_SIZE):
+            batch = added[start:start + INSERT_BATCH_SIZE]
+            await db.upsert("documents", await asyncio.to_thread(embed_batch, batch), batch_size=INSERT_BATCH_SIZE)
+
+            done = start + len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"🧮 Embedded + stored {done}/{len(added)} new chunks ({done / elapsed:.1f} chunks/s)")
+
+        await db.update_in("documents", {"version": version}, "id", bump, batch_size=INSERT_BATCH_SIZE)
+        await db.delete_in("documents", "id", retired, batch_size=INSERT_BATCH_SIZE)
+    print(f"💾 Stored {len(added)} new, {len(bump)} re-versioned, {len(retired)} retired chunks "
+          f"in {time.perf_counter() - started:.1f}s")
+
+def fetch_existing_chunks(document_key, page_size=1000):
+    """
+    All chunks currently stored for the document (without embeddings), whichever file they came from.
+    Rows stored before document keys existed are matched by their source file.
+    """
+    rows, offset = [], 0
+    while True:
+        page = clients.supabase.table("documents").select("id, content, tags, version").or_(
+            f'document_key.eq."{document_key}",and(document_key.is.null,source_file.eq."{document_key}")'
+        ).order("id").range(offset, offset + page_size - 1).execute().data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+def fetch_embeddings(ids):
+    """Stored embeddings by id. pgvector values come back from PostgREST as '[...]' strings."""
+    embeddings = {}
+    for start in range(0, len(ids), INSERT_BATCH_SIZE):
+        data = clients.supabase.table("documents").select("id, embedding").in_("id", ids[start:start + INSERT_BATCH_SIZE]).execute().data
+        for row in data:
+            value = row["embedding"]
+            if value is not None:
+                embeddings[row["id"]] = json.loads(value) if isinstance(value, str) else value
+    return embeddings
 
 # ----------------------------
 # CLI entrypoint
@@ -325,11 +498,12 @@ def ingest_file(file_path: str, force_method: str = None, version: str = None):
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 2:
-        print("❌ Usage: python embedding_to_supabase.py <file> [force_method] [version]")
+        print("❌ Usage: python embedding_to_supabase.py <file> [force_method] [version] [document_key]")
         sys.exit(1)
 
     file_path = sys.argv[1]
     force_method = sys.argv[2] if len(sys.argv) > 2 else None
     version = sys.argv[3] if len(sys.argv) > 3 else None
+    document_key = sys.argv[4] if len(sys.argv) > 4 else None
 
-    ingest_file(file_path, force_method, version)
+    ingest_file(file_path, force_method, version, document_key)
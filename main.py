@@ -1,12 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# before any routes / services import: services.clients reads the credentials on import
+load_dotenv()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import routes.metrics as metrics
 import routes.query as query   # safer import style for Render
 from fastapi.middleware.cors import CORSMiddleware
+from services import warmup
+from services.clients import clients
+from services.telemetry import request_seconds, server_timing, start_request
+
+# Clients are created once per process and shared through dependency injection (services/clients.py).
+# Index loading and the optional warm-up (WARMUP=1) run in the background so the port opens right away;
+# point the platform health check at /ready to keep traffic away until they finished.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    clients.open()
+    startup = asyncio.create_task(warmup.start())
+    yield
+    startup.cancel()
+    await clients.aclose()
 
 # Create FastAPI app
 app = FastAPI(
     title="Accounting Support App",
     description="Ask questions, get answers from uploaded documents",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS (so FlutterFlow can call this API)
@@ -18,10 +43,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request stage timings: Server-Timing header + request latency histogram (see /metrics)
+@app.middleware("http")
+async def telemetry(request: Request, call_next):
+    state = start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    request_seconds.observe(elapsed, route.path if route else "unmatched", response.status_code)
+    # streamed responses send their headers before generation, later stages only reach /metrics
+    response.headers["Server-Timing"] = ", ".join(filter(None, [server_timing(state), f"total;dur={elapsed * 1000:.1f}"]))
+    return response
+
 # Register routes
 app.include_router(query.router)
+app.include_router(metrics.router)
 
 # Root endpoint (just to test if server is running)
 @app.get("/")
 async def root():
     return {"message": "FastAPI is running! Go to /docs for Swagger UI."}
+
+# Readiness endpoint: 503 until the indexes are loaded and the warm-up finished
+@app.get("/ready")
+async def ready():
+    return JSONResponse(warmup.readiness.report(), status_code=200 if warmup.readiness.ready else 503)
@@ -0,0 +1,45 @@
+import argparse
+import os
+
+import numpy as np
+
+from services.local_index import LOCAL_INDEX_DIR
+from services.quantization import RESCORE_FACTOR, recall_report
+
+# ----------------------------
+# Recall of quantized, shortened embeddings against full precision
+# ----------------------------
+# Runs offline on the local index snapshot (RETRIEVAL_BACKEND=local writes it to LOCAL_INDEX_DIR),
+# stored chunk vectors are used as the sample queries.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall of EMBEDDING_STORAGE=int8 / binary vs. float32 search")
+    parser.add_argument("--table", default="documents")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled query vectors")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dimensions", default="128,256,512")
+    parser.add_argument("--factor", type=int, default=RESCORE_FACTOR, help="shortlist size = top_k × factor")
+    args = parser.parse_args()
+
+    matrix_path = os.path.join(LOCAL_INDEX_DIR, f"{args.table}.npy")
+    if not os.path.exists(matrix_path):
+        print(f"❌ No snapshot at {matrix_path}, run the API once with RETRIEVAL_BACKEND=local")
+        return
+
+    matrix = np.load(matrix_path, mmap_mode="r")
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(matrix), size=min(args.queries, len(matrix)), replace=False)
+    queries = np.asarray(matrix[np.sort(sample)], dtype=np.float32)
+    dimensions = [int(d) for d in args.dimensions.split(",")]
+
+    print(f"📊 {args.table}: {matrix.shape[0]} vectors × {matrix.shape[1]} dims "
+          f"({matrix.shape[1] * 4} bytes each), {len(queries)} queries, recall@{args.top_k}")
+    print(f"{'storage':<8} {'dims':>5} {'bytes':>6} {'first pass':>11} {'rescored':>9} {'ms/query':>9}")
+    for row in recall_report(matrix, queries, args.top_k, dimensions=dimensions, factor=args.factor):
+        print(f"{row['storage']:<8} {row['dimensions']:>5} {row['bytes_per_vector']:>6} "
+              f"{row['recall_first_pass']:>11.3f} {row['recall_rescored']:>9.3f} {row['ms_per_query']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
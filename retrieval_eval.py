@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.context_builder import build_context, count_tokens
+from services.cutoff import adaptive_cutoff
+from services.local_index import LocalVectorIndex, normalize_rows
+from services.telemetry import log
+
+# ----------------------------
+# Retrieval quality vs. latency evaluation
+# ----------------------------
+# Golden set: JSON list of {"question": "...", "relevant_ids": ["<documents.id>", ...]}
+#
+#   python retrieval_eval.py prepare --golden golden.json   (needs OpenAI + Supabase, run once)
+#   python retrieval_eval.py run --golden golden.json       (offline sweep over the snapshot)
+#
+# `prepare` snapshots the documents table, embeds chunks and questions with both models, expands
+# the questions and records the API latency of each step. `run` replays every retrieval
+# configuration against that snapshot without any network access.
+
+SNAPSHOT_DIR = os.path.join(".cache", "retrieval_eval")
+MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+ROW_COLUMNS = ["id", "title", "content", "tags", "method", "source_file", "version"]
+PAGE_SIZE = 500
+
+# parameters swept by `run`
+TOP_KS = (3, 5, 10, 15)
+THRESHOLDS = (0.1, 0.2, 0.3, 0.4)
+CUTOFFS = ("fixed", "adaptive")
+
+
+def load_golden(path):
+    with open(path, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    return [g for g in golden if g.get("relevant_ids")]
+
+
+# ----------------------------
+# prepare (online, once)
+# ----------------------------
+def fetch_documents(supabase):
+    rows, after_id = [], None
+    while True:
+        query = supabase.table("documents").select(", ".join(ROW_COLUMNS))
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        page = query.order("id").limit(PAGE_SIZE).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        after_id = page[-1]["id"]
+
+
+def timed_embedding(sync_client, model, text):
+    """Embeds one question directly (no cache) so the recorded latency is a real API round trip."""
+    started = time.perf_counter()
+    response = sync_client.embeddings.create(model=model, input=text)
+    return response.data[0].embedding, (time.perf_counter() - started) * 1000
+
+
+def prepare(golden_path, snapshot_dir):
+    from services.clients import clients
+    from services.embeddings import expand_user_query, get_embeddings_sync
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    rows = fetch_documents(clients.supabase)
+    with open(os.path.join(snapshot_dir, "rows.json"), "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    print(f"📥 {len(rows)} chunks of the documents table saved")
+
+    for model in MODELS:
+        vectors = get_embeddings_sync([r["content"] for r in rows], model=model)
+        np.save(os.path.join(snapshot_dir, f"documents.{model}.npy"), normalize_rows(np.asarray(vectors, dtype=np.float32)))
+        print(f"🧮 Chunks embedded with {model}")
+
+    async def expand_all(items):
+        # one after another, so each recorded latency is a single expansion
+        expansions = []
+        for item in items:
+            started = time.perf_counter()
+            expanded = await expand_user_query(item["question"])
+            expansions.append((expanded, (time.perf_counter() - started) * 1000))
+        return expansions
+
+    golden = load_golden(golden_path)
+    # a single event loop for all expansions: the shared AsyncOpenAI pool is bound to the loop it was first used on
+    expansions = asyncio.run(expand_all(golden))
+
+    questions, vectors = [], {model: {"raw": [], "expanded": []} for model in MODELS}
+    for item, (expanded, expansion_ms) in zip(golden, expansions):
+        latency = {"expansion": expansion_ms}
+        for model in MODELS:
+            raw_vector, latency[model] = timed_embedding(clients.sync_openai, model, item["question"])
+            expanded_vector, _ = timed_embedding(clients.sync_openai, model, expanded)
+            vectors[model]["raw"].append(raw_vector)
+            vectors[model]["expanded"].append(expanded_vector)
+        questions.append({**item, "expanded": expanded, "latency_ms": latency})
+
+    with open(os.path.join(snapshot_dir, "questions.json"), "w", encoding="utf-8") as f:
+        json.dump(questions, f, ensure_ascii=False, indent=2)
+    for model in MODELS:
+        np.savez(os.path.join(snapshot_dir, f"questions.{model}.npz"),
+                 raw=np.asarray(vectors[model]["raw"], dtype=np.float32),
+                 expanded=np.asarray(vectors[model]["expanded"], dtype=np.float32))
+    print(f"✅ Snapshot with {len(questions)} questions written to {snapshot_dir}")
+
+
+# ----------------------------
+# run (offline)
+# ----------------------------
+def load_snapshot(snapshot_dir):
+    with open(os.path.join(snapshot_dir, "rows.json"), "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    with open(os.path.join(snapshot_dir, "questions.json"), "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    indexes, query_vectors = {}, {}
+    for model in MODELS:
+        index = LocalVectorIndex(None, "documents", ROW_COLUMNS, directory=snapshot_dir)
+        index.matrix = np.load(os.path.join(snapshot_dir, f"documents.{model}.npy"))
+        index.rows = rows
+        index._loaded = True
+        index.quantized = index.quantize(index.matrix)
+        indexes[model] = index
+        with np.load(os.path.join(snapshot_dir, f"questions.{model}.npz")) as data:
+            query_vectors[model] = {"raw": data["raw"], "expanded": data["expanded"]}
+    return questions, indexes, query_vectors
+
+
+def score(results, relevant, top_k):
+    retrieved = [r["id"] for r in results]
+    recall = len(relevant & set(retrieved[:top_k])) / len(relevant)
+    rank = next((i for i, row_id in enumerate(retrieved, 1) if row_id in relevant), None)
+    return recall, 1.0 / rank if rank else 0.0
+
+
+def evaluate(questions, indexes, query_vectors):
+    report = []
+    for model, expansion, top_k, threshold, cutoff in itertools.product(MODELS, (False, True), TOP_KS, THRESHOLDS, CUTOFFS):
+        vectors = query_vectors[model]["expanded" if expansion else "raw"]
+        recalls, reciprocal_ranks, latencies, tokens, chunks = [], [], [], [], []
+
+        for question, vector in zip(questions, vectors):
+            started = time.perf_counter()
+            results = indexes[model].search(vector, top_k, threshold)
+            if cutoff == "adaptive":
+                results = adaptive_cutoff(results, enabled=True)
+            search_ms = (time.perf_counter() - started) * 1000
+
+            recall, reciprocal_rank = score(results, set(question["relevant_ids"]), top_k)
+            recalls.append(recall)
+            reciprocal_ranks.append(reciprocal_rank)
+            latency = question["latency_ms"]
+            latencies.append(latency[model] + (latency["expansion"] if expansion else 0.0) + search_ms)
+            tokens.append(count_tokens(build_context(results)) if results else 0)
+            chunks.append(len(results))
+
+        report.append({
+            "model": model, "expansion": expansion, "top_k": top_k, "threshold": threshold, "cutoff": cutoff,
+            "recall": float(np.mean(recalls)), "mrr": float(np.mean(reciprocal_ranks)),
+            "latency_ms": float(np.mean(latencies)), "p95_latency_ms": float(np.percentile(latencies, 95)),
+            "prompt_tokens": float(np.mean(tokens)), "chunks": float(np.mean(chunks)),
+        })
+    return report
+
+
+def run(golden_path, snapshot_dir, min_recall, out):
+    # per-call context / cutoff log lines would drown the report
+    log.setLevel(logging.WARNING)
+    questions, indexes, query_vectors = load_snapshot(snapshot_dir)
+    golden = {g["question"] for g in load_golden(golden_path)}
+    questions = [q for q in questions if q["question"] in golden]
+    if not questions:
+        print(f"❌ None of the golden questions is in the snapshot at {snapshot_dir}, run prepare first")
+        return
+
+    report = sorted(evaluate(questions, indexes, query_vectors), key=lambda r: (r["latency_ms"], r["prompt_tokens"]))
+    print(f"📊 {len(questions)} questions, {len(report)} configurations (latency = API latency recorded by prepare + local search)")
+    print(f"{'model':<23} {'exp':>3} {'k':>3} {'thr':>4} {'cutoff':>8} {'recall':>7} {'mrr':>6} {'ms':>7} {'p95 ms':>7} {'tokens':>7} {'chunks':>6}")
+    for r in report:
+        print(f"{r['model']:<23} {'on' if r['expansion'] else 'off':>3} {r['top_k']:>3} {r['threshold']:>4} {r['cutoff']:>8} "
+              f"{r['recall']:>7.3f} {r['mrr']:>6.3f} {r['latency_ms']:>7.0f} {r['p95_latency_ms']:>7.0f} "
+              f"{r['prompt_tokens']:>7.0f} {r['chunks']:>6.1f}")
+
+    passing = [r for r in report if r["recall"] >= min_recall]
+    if passing:
+        best = passing[0]
+        print(f"\n🏆 Fastest configuration with recall >= {min_recall}: {best['model']}, expansion "
+              f"{'on' if best['expansion'] else 'off'}, top_k={best['top_k']}, threshold={best['threshold']}, "
+              f"{best['cutoff']} cutoff ({best['latency_ms']:.0f} ms, ~{best['prompt_tokens']:.0f} prompt tokens)")
+    else:
+        print(f"\n⚠️ No configuration reaches recall {min_recall}")
+
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report saved to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality vs. latency sweep over a golden question set")
+    parser.add_argument("command", choices=("prepare", "run"))
+    parser.add_argument("--golden", required=True, help='JSON list of {"question", "relevant_ids"}')
+    parser.add_argument("--snapshot", default=SNAPSHOT_DIR)
+    parser.add_argument("--min-recall", type=float, default=0.8, help="quality bar for the recommendation")
+    parser.add_argument("--out", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        prepare(args.golden, args.snapshot)
+    else:
+        run(args.golden, args.snapshot, args.min_recall, args.out)
+
+
+if __name__ == "__main__":
+    main()
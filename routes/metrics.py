@@ -0,0 +1,37 @@
+# routes/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.answer_cache import answer_cache
+from services.clients import clients
+from services.embedding_cache import embedding_cache
+from services.query_expansion import expansion_cache
+from services.single_flight import embedding_flights, expansion_flights, generation_flights, retrieval_flights, stream_broadcaster
+from services.telemetry import openai_tokens, render_gauges, request_seconds, stage_seconds
+
+router = APIRouter()
+
+@router.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text format: per-stage and per-request latency histograms, OpenAI token usage,
+    cache hit rates, request coalescing counters and Supabase retry / hedging counters.
+    """
+    families = [
+        stage_seconds.render(),
+        request_seconds.render(),
+        openai_tokens.render(),
+        render_gauges("rag_cache", "Cache statistics (hits, misses, hit_rate, items)", "cache", {
+            "embedding": embedding_cache.stats(),
+            "expansion": expansion_cache.stats(),
+            "answer": answer_cache.stats(),
+        }),
+        render_gauges("rag_single_flight", "Identical in-flight work started, coalesced and abandoned", "stage", {
+            flights.name: flights.stats()
+            for flights in (expansion_flights, embedding_flights, retrieval_flights, generation_flights, stream_broadcaster)
+        }),
+        render_gauges("rag_supabase", "Supabase requests, retries, timeouts and hedged reads", "client", {
+            "api": clients.supabase_data.stats(),
+        }),
+    ]
+    return PlainTextResponse("\n".join(families) + "\n", media_type="text/plain; version=0.0.4")
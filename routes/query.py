@@ -4,19 +4,59 @@ from fastapi.responses import StreamingResponse
 
 load_dotenv()
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
 from models.query_request import QueryRequest
-from services.embeddings import expand_user_query, extract_source_ids_from_res, get_embedding, get_ai_response, remove_uuid_line, stream_openai_response
-from services.supabase_client import match_documents, match_knowledge_base
-from openai import OpenAI
+from services.answer_cache import answer_cache
+from services.citation_index import citation_index
+from services.clients import get_openai
+from services.embeddings import expand_user_query, extract_source_ids_from_res, get_embedding, get_embeddings, get_ai_response, remove_uuid_line, replay_cached_answer, stream_openai_response
+from services.retrieval import FEDERATED_RETRIEVAL, HYBRID_RETRIEVAL, SPECULATIVE_RETRIEVAL, STORES, adaptive_cutoff, embed_for_stores, federated_search, hybrid_retrieve, speculative_retrieve
+from services.supabase_client import documents_fingerprint, match_documents, match_knowledge_base
+from services.telemetry import log, record_usage, timed
+from openai import AsyncOpenAI
 import os
 import json
 import asyncio
 
 router = APIRouter()
 
-# Init OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# /query/batch: questions retrieved and answered at the same time
+QUERY_BATCH_CONCURRENCY = int(os.environ.get("QUERY_BATCH_CONCURRENCY", "8"))
+
+def prefetch_expansion(question):
+    """Starts the query expansion while the answer cache is checked; expand_user_query calls for the same question join it."""
+    task = asyncio.create_task(expand_user_query(question))
+    # the task may be abandoned on a cache hit, make sure its outcome is always retrieved
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+async def cached_answer(question, model):
+    """
+    Answer cache lookup keyed on the embedding of the *raw* question. The expanded query must not be
+    the key: the glossary maps different questions (and the same question in other languages) onto
+    the same search query, whose cached answer would then be served to all of them.
+    Returns (key embedding, cached answer or None).
+    """
+    with timed("cache"):
+        await answer_cache.ensure_fresh(documents_fingerprint)
+        embedding = await get_embedding(question, model=model)
+        return embedding, answer_cache.lookup(model, embedding)
+
+async def answer_question(question, results, embedding=None):
+    """Generates the /query answer over `results` and stores it in the answer cache."""
+    with timed("generation"):
+        response = await get_ai_response(knowledge_base=results, question=question)
+
+    used_ids = extract_source_ids_from_res(response.output_text)
+
+    answer = {
+        "text": remove_uuid_line(response.output_text) if used_ids else response.output_text,
+        "sources": [{"id": r.get("id"), "title": r.get("title")} for r in results if r.get("id") in used_ids],
+    }
+    if embedding is not None:
+        answer_cache.store("text-embedding-3-large", embedding, answer)
+    return answer
 
 @router.post("/query", summary="Query Docs (raw chunks)")
 async def query_docs(req: QueryRequest):
@@ -27,48 +67,159 @@ async def query_docs(req: QueryRequest):
     Returns raw matches only.
     """
     try:
-        print("🔹 Incoming request:", req.dict())
-        expanded_q = expand_user_query(req.question)
-
-        print("🔹 Generating embedding...")
-        embedding = get_embedding(expanded_q)
-        print(f"✅ Embedding created. First 5 values: {embedding[:5]}")
-
-        print("🔹 Querying Supabase for matches...")
-        results = match_knowledge_base(embedding, 15)
-        print(f"✅ Supabase returned {len(results)} matches")
-
-        response = get_ai_response(knowledge_base=results, question=req.question)
-
-        used_ids = extract_source_ids_from_res(response.output_text)
-
-        return {
-            "text": remove_uuid_line(response.output_text) if used_ids else response.output_text,
-            "sources": [{"id": r.get("id"), "title": r.get("title")} for r in results if r.get("id") in used_ids],
-        }
+        log.info(f"🔹 /query: {len(req.question)} chars")
+        # explicit § citations are resolved from the citation index, no expansion / embedding needed
+        embedding = None
+        results = citation_index.lookup(req.question)
+        if results:
+            log.info(f"✅ {len(results)} chunks found in the § citation index")
+        else:
+            expansion = prefetch_expansion(req.question)
+            embedding, cached = await cached_answer(req.question, "text-embedding-3-large")
+            if cached is not None:
+                expansion.cancel()
+                log.info("✅ Answer served from semantic cache")
+                return cached
+
+            with timed("expansion"):
+                expanded_q = await expansion
+
+            with timed("embedding"):
+                if FEDERATED_RETRIEVAL:
+                    # one embedding per store model, computed in parallel
+                    search_embeddings = await embed_for_stores(expanded_q)
+                else:
+                    search_embedding = await get_embedding(expanded_q)
+
+            with timed("retrieval"):
+                if FEDERATED_RETRIEVAL:
+                    results = await federated_search(search_embeddings, 15)
+                else:
+                    results = await match_knowledge_base(search_embedding, 15)
+            log.info(f"✅ Supabase returned {len(results)} matches")
+            # 15 candidates are fetched once, only the clearly relevant ones go to the LLM
+            results = adaptive_cutoff(results)
+
+        return await answer_question(req.question, results, embedding)
 
     except Exception as e:
-        print("❌ ERROR in query_docs:", str(e))
+        log.error(f"❌ ERROR in query_docs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/query/batch", summary="Query Docs for many questions (NDJSON stream)")
+async def query_batch(reqs: List[QueryRequest]):
+    """
+    Answers many questions the way /query does, for regression and cache prewarm runs.
+    Expanded questions are embedded with multi-input embeddings calls, retrieval and
+    generation run for up to QUERY_BATCH_CONCURRENCY questions at a time.
+    Streams one JSON line per question as soon as it is answered:
+    {"index": ..., "question": ..., "text": ..., "sources": [...]} or {"index": ..., "question": ..., "error": ...}.
+    """
+    log.info(f"🔹 Incoming batch of {len(reqs)} questions")
+    semaphore = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    async def answer(index, results=None, embeddings=None, cache_embedding=None):
+        question = reqs[index].question
+        try:
+            async with semaphore:
+                if results is None:
+                    cached = answer_cache.lookup("text-embedding-3-large", cache_embedding)
+                    if cached is not None:
+                        return {"index": index, "question": question, **cached}
+                    if FEDERATED_RETRIEVAL:
+                        results = await federated_search(embeddings, 15)
+                    else:
+                        results = await match_knowledge_base(embeddings["text-embedding-3-large"], 15)
+                    results = adaptive_cutoff(results)
+                return {"index": index, "question": question, **await answer_question(question, results, cache_embedding)}
+        except Exception as e:
+            log.error(f"❌ ERROR in query_batch (question {index}): {e}")
+            return {"index": index, "question": question, "error": str(e)}
+
+    def error_line(index, error):
+        return json.dumps({"index": index, "question": reqs[index].question, "error": str(error)}, ensure_ascii=False) + "\n"
+
+    async def lines():
+        tasks, handled = [], set()
+        # the client may disconnect at any point: the answers still running are cancelled with the stream
+        try:
+            # explicit § citations need no expansion / embedding, they are answered right away
+            pending = []
+            for index, req in enumerate(reqs):
+                cited = citation_index.lookup(req.question)
+                if cited:
+                    tasks.append(asyncio.create_task(answer(index, results=cited)))
+                    handled.add(index)
+                else:
+                    pending.append(index)
+
+            if pending:
+                try:
+                    # the answer cache is keyed on the raw questions, embedded while the questions are expanded;
+                    # a failed expansion only fails its own question
+                    questions = [reqs[i].question for i in pending]
+                    raw_vectors, expanded, _ = await asyncio.gather(
+                        get_embeddings(questions, model="text-embedding-3-large"),
+                        asyncio.gather(*(bounded(expand_user_query(q)) for q in questions), return_exceptions=True),
+                        answer_cache.ensure_fresh(documents_fingerprint),
+                    )
+                    expansions = []
+                    for position, (index, query) in enumerate(zip(pending, expanded)):
+                        if isinstance(query, Exception):
+                            log.error(f"❌ ERROR in query_batch (question {index}): {query}")
+                            handled.add(index)
+                            yield error_line(index, query)
+                        else:
+                            expansions.append((position, index, query))
+
+                    if expansions:
+                        # one embedding per store model when federated, batched across all questions
+                        models = list(dict.fromkeys(store["model"] for store in STORES.values())) if FEDERATED_RETRIEVAL \
+                            else ["text-embedding-3-large"]
+                        queries = [query for _, _, query in expansions]
+                        vectors = await asyncio.gather(*(get_embeddings(queries, model=model) for model in models))
+                        for slot, (position, index, _) in enumerate(expansions):
+                            embeddings = {model: vectors[m][slot] for m, model in enumerate(models)}
+                            tasks.append(asyncio.create_task(answer(index, embeddings=embeddings, cache_embedding=raw_vectors[position])))
+                            handled.add(index)
+                except Exception as e:
+                    # a shared embeddings call failed, only the questions waiting for it get its error
+                    log.error(f"❌ ERROR in query_batch: {e}")
+                    for index in pending:
+                        if index not in handled:
+                            yield error_line(index, e)
+
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.post("/ask", summary="Ask GPT with context")
-async def ask_gpt(req: QueryRequest):
+async def ask_gpt(req: QueryRequest, client: AsyncOpenAI = Depends(get_openai)):
     """
     Takes a natural language question,
     fetches relevant document chunks from Supabase,
     then sends them as context to GPT for a polished answer.
     """
     try:
-        print("🔹 Incoming request:", req.dict())
+        log.info(f"🔹 /ask: {len(req.question)} chars, top_k={req.top_k}")
 
         # Step 1: Create embedding for the question
-        print("🔹 Generating embedding...")
-        embedding = get_embedding(req.question)
+        with timed("embedding"):
+            embedding = await get_embedding(req.question)
 
         # Step 2: Query Supabase with embedding
-        print("🔹 Querying Supabase for matches...")
-        results = match_documents(embedding, req.top_k)
+        with timed("retrieval"):
+            results = adaptive_cutoff(await match_documents(embedding, req.top_k))
 
         # Step 3: Build GPT prompt with context
         context = "\n\n".join([r.get("content", "") for r in results])
@@ -78,15 +229,16 @@ async def ask_gpt(req: QueryRequest):
         ]
 
         # Step 4: Call GPT
-        print("🔹 Calling OpenAI GPT...")
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=messages,
-            temperature=0.3
-        )
+        with timed("generation"):
+            completion = await client.chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=messages,
+                temperature=0.3
+            )
+        record_usage("gpt-4.1-mini", completion.usage)
 
         answer = completion.choices[0].message.content
-        print("✅ GPT response generated")
+        log.info("✅ GPT response generated")
 
         # Step 5: Return structured response
         return {
@@ -96,7 +248,7 @@ async def ask_gpt(req: QueryRequest):
         }
 
     except Exception as e:
-        print("❌ ERROR in ask_gpt:", str(e))
+        log.error(f"❌ ERROR in ask_gpt: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -108,28 +260,85 @@ async def stream(req: QueryRequest):
                 yield f"data: {json.dumps({'status': 'Analyzing users question...'})}\n\n"
                 await asyncio.sleep(0)
 
-                expanded_q = expand_user_query(req.question)
+                # explicit § citations are resolved from the citation index, no expansion / embedding needed
+                cited = citation_index.lookup(req.question)
+                if cited:
+                    log.info(f"✅ {len(cited)} chunks found in the § citation index")
+                    yield f"data: {json.dumps({'status': 'Analyzing sources...'})}\n\n"
+                    async for chunk in stream_openai_response(cited, req.question):
+                        yield chunk
+                    return
+
+                # the answer cache is checked before any retrieval, keyed on the raw question; the speculative
+                # path starts the expansion itself, so it can cancel it when the raw hits are confident
+                expansion = None if SPECULATIVE_RETRIEVAL else prefetch_expansion(req.question)
+                embedding, cached = await cached_answer(req.question, "text-embedding-3-small")
+                if cached is not None:
+                    if expansion is not None:
+                        expansion.cancel()
+                    async for chunk in replay_cached_answer(cached):
+                        yield chunk
+                    return
+
+                if SPECULATIVE_RETRIEVAL:
+                    # raw question is searched while the expansion runs, see services/retrieval.py
+                    yield f"data: {json.dumps({'status': 'Searching relevant sources...'})}\n\n"
+                    with timed("retrieval"):
+                        results, _ = await speculative_retrieve(req.question, req.top_k, threshold=0.1)
+                    log.info(f"✅ Supabase returned {len(results)} matches")
+                    results = adaptive_cutoff(results)
+
+                    yield f"data: {json.dumps({'status': 'Analyzing sources...'})}\n\n"
+
+                    def remember(text, sources):
+                        answer_cache.store("text-embedding-3-small", embedding, {"text": text, "sources": sources})
+
+                    async for chunk in stream_openai_response(results, req.question, on_complete=remember):
+                        yield chunk
+                    return
+
+                with timed("expansion"):
+                    expanded_q = await expansion
 
                 yield f"data: {json.dumps({'status': 'Preparing search query...'})}\n\n"
                 await asyncio.sleep(0)
 
                 #generate vectors from users question. knowledge_base - larger model(3072 vector size), documents - smaller model(1536 vector size)
                 # embedding = get_embedding(expanded_q, model="text-embedding-3-large") # for knowledge_base table larger model
-                embedding = get_embedding(expanded_q, model="text-embedding-3-small") # for documents table smaller model
+                with timed("embedding"):
+                    if FEDERATED_RETRIEVAL:
+                        # both tables, each with its own model, embeddings computed in parallel
+                        embeddings = await embed_for_stores(expanded_q)
+                    elif HYBRID_RETRIEVAL:
+                        # BM25 runs while the question is embedded, see services/retrieval.py
+                        results, _ = await hybrid_retrieve(expanded_q, req.top_k, threshold=0.1)
+                    else:
+                        search_embedding = await get_embedding(expanded_q, model="text-embedding-3-small") # for documents table smaller model
 
                 yield f"data: {json.dumps({'status': 'Searching relevant sources...'})}\n\n"
                 await asyncio.sleep(0)
 
-                # results = match_knowledge_base(embedding, req.top_k) # vector search in knowledge_base table
-                results = match_documents(embedding, req.top_k, threshold=0.1) # vector search in documents table
-                print(f"✅ Supabase returned {len(results)} matches")
+                with timed("retrieval"):
+                    if FEDERATED_RETRIEVAL:
+                        results = await federated_search(embeddings, req.top_k) # documents + knowledge_base, rank fusion
+                    elif HYBRID_RETRIEVAL:
+                        pass # already searched (lexical + vector) together with the embedding
+                    else:
+                        # results = match_knowledge_base(embedding, req.top_k) # vector search in knowledge_base table
+                        results = await match_documents(search_embedding, req.top_k, threshold=0.1) # vector search in documents table
+                log.info(f"✅ Supabase returned {len(results)} matches")
+                # req.top_k candidates are fetched once, only the clearly relevant ones go to the LLM
+                results = adaptive_cutoff(results)
 
 
                 yield f"data: {json.dumps({'status': 'Analyzing sources...'})}\n\n"
                 await asyncio.sleep(0)
 
                 # for final chat gpt response changing sources table does not change anything
-                async for chunk in stream_openai_response(results, req.question):
+                def remember(text, sources):
+                    answer_cache.store("text-embedding-3-small", embedding, {"text": text, "sources": sources})
+
+                async for chunk in stream_openai_response(results, req.question, on_complete=remember):
                     yield chunk
             except Exception as e:
                 yield f"data: {json.dumps({'error': 'Something went wrong', 'exception': str(e)})}"
@@ -137,6 +346,6 @@ async def stream(req: QueryRequest):
         return StreamingResponse(event_stream(), media_type="text/event-stream")
 
     except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
+        log.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Something went wrong")
 
@@ -1,43 +1,105 @@
 import os
-from openai import OpenAI
-from supabase import create_client, Client
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Shared embedding path (uses the on-disk embedding cache, so re-runs skip known texts)
+from services.clients import clients
+from services.embeddings import get_embedding_sync, get_embeddings_sync
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+CHECKPOINT_FILE = os.path.join(".cache", "seed_embedding.checkpoint")
 
 
 def get_embedding(text: str):
     """Generate embedding for a given text."""
-    resp = openai_client.embeddings.create(
-        model="text-embedding-3-large",
-        input=text
-    )
-    return resp.data[0].embedding
+    return get_embedding_sync(text, model="text-embedding-3-large")
 
 
-def seed_embeddings(batch_size=50):
-    rows = supabase.table("knowledge_base").select("id, chunk_text").is_("embedding", None).execute()
+def fetch_page(after_id, page_size):
+    """Next page of rows without embedding, keyset-paginated by id."""
+    query = clients.supabase.table("knowledge_base").select("id, chunk_text").is_("embedding", None)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return query.order("id").limit(page_size).execute().data
+
+
+def embed_page(rows):
+    """
+    Embeds one page with a single batched call and writes back only the embedding column, row by row,
+    so concurrent edits of the other columns are never overwritten.
+    """
+    embeddings = get_embeddings_sync([row["chunk_text"] for row in rows], model="text-embedding-3-large")
+    for row, embedding in zip(rows, embeddings):
+        clients.supabase.table("knowledge_base").update({"embedding": embedding}).eq("id", row["id"]).execute()
+    return len(rows)
+
+
+def read_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    return None
 
-    if not rows.data:
-        print("No rows left without embeddings.")
-        return
 
-    print(f"Found {len(rows.data)} rows to update...")
+def write_checkpoint(last_id):
+    os.makedirs(os.path.dirname(CHECKPOINT_FILE), exist_ok=True)
+    with open(CHECKPOINT_FILE, "w", encoding="utf-8") as f:
+        f.write(str(last_id))
 
-    for i, row in enumerate(rows.data):
-        embedding = get_embedding(row["chunk_text"])
 
-        supabase.table("knowledge_base").update({"embedding": embedding}).eq("id", row["id"]).execute()
+def seed_embeddings(batch_size=50, workers=4):
+    """
+    Streams rows with a null embedding page by page (keyset on id), embeds each page with one
+    batched call and writes the embeddings back. Up to `workers` pages are in flight at once.
+    Safe to kill: finished pages are already stored and the checkpoint only advances past pages
+    that completed in order, so a re-run continues from there without skipping anything.
+    """
+    after_id = read_checkpoint()
+    if after_id:
+        print(f"↩️ Resuming after id {after_id}")
 
-        print(f"Updated row {i+1}/{len(rows.data)}: {row['id']}")
+    started = time.perf_counter()
+    updated = 0
+    failed = False
+    pending = []  # [(last_id, future)] in page order
 
+    def settle(block):
+        nonlocal updated, failed
+        while pending and (block or pending[0][1].done()):
+            last_id, future = pending.pop(0)
+            block = False
+            try:
+                updated += future.result()
+            except Exception as e:
+                print(f"❌ Page ending at {last_id} failed: {e}")
+                failed = True
+                continue
+            if not failed:
+                write_checkpoint(last_id)
+            print(f"Updated {updated} rows up to {last_id} ({updated / (time.perf_counter() - started):.1f} rows/s)")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = fetch_page(after_id, batch_size)
+            if not rows:
+                break
+            after_id = rows[-1]["id"]
+            pending.append((after_id, pool.submit(embed_page, rows)))
+
+            # bounded pipeline: wait for the oldest page before fetching too far ahead
+            settle(block=len(pending) >= workers * 2)
+
+        while pending:
+            settle(block=True)
+
+    if updated == 0 and not failed:
+        print("No rows left without embeddings.")
+    if not failed and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+    print(f"✅ Backfill finished: {updated} rows in {time.perf_counter() - started:.1f}s"
+          + (" (some pages failed, re-run to resume)" if failed else ""))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+# services/answer_cache.py
+
+import os
+import time
+
+import numpy as np
+
+from services.telemetry import log
+
+# Answer cache configuration (override via environment variables)
+ANSWER_CACHE_MAX_DISTANCE = float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE", "0.05"))  # cosine distance
+ANSWER_CACHE_ITEMS = int(os.environ.get("ANSWER_CACHE_ITEMS", "1000"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get("ANSWER_CACHE_VERSION_CHECK_INTERVAL", "60"))
+
+
+class AnswerCache:
+    """
+    Semantic cache of full answers ({"text": ..., "sources": [...]}) keyed by the embedding of the
+    raw user question (never of the expanded query, which many different questions share).
+    A question whose embedding lies within `max_distance` (cosine) of a cached one reuses its answer.
+    Entries are kept per embedding model, vectors of different models are never compared.
+    The whole cache is dropped when the documents corpus fingerprint changes (new ingest/version).
+    """
+
+    def __init__(self, max_distance=ANSWER_CACHE_MAX_DISTANCE, max_items=ANSWER_CACHE_ITEMS, ttl=ANSWER_CACHE_TTL,
+                 version_check_interval=ANSWER_CACHE_VERSION_CHECK_INTERVAL):
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._entries = {}    # model -> list of (created_at, answer)
+        self._matrices = {}   # model -> normalized float32 matrix, one row per entry
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, model, embedding):
+        """Returns the cached answer closest to `embedding` if it is within max_distance, else None."""
+        matrix = self._matrices.get(model)
+        if matrix is None or not len(matrix):
+            self.misses += 1
+            return None
+
+        similarities = matrix @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+        created_at, answer = self._entries[model][best]
+        if 1.0 - float(similarities[best]) > self.max_distance or time.time() - created_at > self.ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return answer
+
+    def store(self, model, embedding, answer):
+        entries = self._entries.setdefault(model, [])
+        vector = self._normalize(embedding)[None, :]
+        matrix = self._matrices.get(model)
+
+        entries.append((time.time(), answer))
+        matrix = vector if matrix is None else np.vstack([matrix, vector])
+
+        # evict oldest entries first
+        overflow = len(entries) - self.max_items
+        if overflow > 0:
+            del entries[:overflow]
+            matrix = matrix[overflow:]
+        self._matrices[model] = matrix
+
+    def invalidate(self):
+        self._entries.clear()
+        self._matrices.clear()
+        self.invalidations += 1
+
+    async def ensure_fresh(self, fetch_fingerprint):
+        """
+        Drops all answers if the corpus changed since the last check.
+        `fetch_fingerprint` is an async callable; it is polled at most every `version_check_interval` seconds.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.version_check_interval:
+            return
+        self._checked_at = now
+
+        try:
+            fingerprint = await fetch_fingerprint()
+        except Exception as e:
+            log.warning(f"⚠️ Answer cache version check failed: {e}")
+            return
+
+        if self._fingerprint is not None and fingerprint != self._fingerprint:
+            log.info(f"🔄 Documents changed ({self._fingerprint} → {fingerprint}), clearing answer cache")
+            self.invalidate()
+        self._fingerprint = fingerprint
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": sum(len(e) for e in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Process-wide answer cache
+answer_cache = AnswerCache()
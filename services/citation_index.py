@@ -0,0 +1,190 @@
+# services/citation_index.py
+
+import json
+import os
+import re
+
+# Citation index configuration (override via environment variables)
+CITATION_INDEX_PATH = os.environ.get("CITATION_INDEX_PATH", os.path.join(".cache", "citation_index.json"))
+CITATION_LOOKUP_TOP_K = int(os.environ.get("CITATION_LOOKUP_TOP_K", "5"))
+CITATION_INDEX_PAGE_SIZE = 1000
+
+# "§ 52 odst. 1 písm. c", "§52 písm. c)", "paragraf 52 odstavec 2", "paragrafu 52a"
+CITATION_PATTERN = re.compile(
+    r"(?:§|\bparagraf\w*)\s*(\d+[a-z]?)\b"
+    r"(?:\s*,?\s*odst(?:\.|avec\w*)\s*(\d+))?"
+    r"(?:\s*,?\s*p[ií]sm(?:\.|en\w*)\s*([a-z])\b)?",
+    re.IGNORECASE,
+)
+
+# chunk fields kept in the index, enough to answer without another database round trip
+ROW_FIELDS = ("id", "title", "content", "tags", "source_file", "document_key", "version")
+HEADING_BONUS = 5  # "§ 52 Zaměstnavatel může ..." looks like the provision itself, not a cross-reference
+
+
+def parse_citations(text):
+    """All (section, subsection, letter) references in `text`, missing parts are None."""
+    return [
+        (section.lower(), subsection or None, letter.lower() if letter else None)
+        for section, subsection, letter in CITATION_PATTERN.findall(text)
+    ]
+
+
+def citation_keys(section, subsection=None, letter=None):
+    """Index keys of a reference, most specific first: 52/1/c, 52//c, 52/1, 52."""
+    keys = []
+    if subsection and letter:
+        keys.append(f"{section}/{subsection}/{letter}")
+    if letter:
+        keys.append(f"{section}//{letter}")
+    if subsection:
+        keys.append(f"{section}/{subsection}")
+    keys.append(section)
+    return keys
+
+
+def defines_section(content, section):
+    """True if `content` looks like the provision itself ("§ 52 Zaměstnavatel může ..."), not a cross-reference."""
+    return re.search(rf"§\s*{re.escape(section)}\s+[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ]", content or "") is not None
+
+
+class CitationIndex:
+    """
+    Maps § references to the chunks that contain them: key → [(chunk id, score)], best first.
+    Built by ingest_file and persisted as JSON; the API loads it at startup (or rebuilds it
+    from the documents table when the file is missing), so explicit citations in a question
+    are resolved with a dict lookup instead of expansion + embedding + vector search.
+    """
+
+    def __init__(self, path=CITATION_INDEX_PATH):
+        self.path = path
+        self.keys = {}
+        self.rows = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ----------------------------
+    # Building
+    # ----------------------------
+    def add_rows(self, rows):
+        for row in rows:
+            content = row.get("content") or ""
+            scores = {}
+            for section, subsection, letter in parse_citations(content):
+                for key in citation_keys(section, subsection, letter):
+                    scores[key] = scores.get(key, 0) + 1
+            if not scores:
+                continue
+
+            for section in {key.split("/")[0] for key in scores}:
+                if defines_section(content, section):
+                    for key in scores:
+                        if key.split("/")[0] == section:
+                            scores[key] += HEADING_BONUS
+
+            self.rows[row["id"]] = {f: row.get(f) for f in ROW_FIELDS}
+            for key, score in scores.items():
+                self.keys.setdefault(key, []).append((row["id"], score))
+
+        for postings in self.keys.values():
+            postings.sort(key=lambda p: p[1], reverse=True)
+
+    def remove_document(self, document_key):
+        """
+        Drops all chunks of one document, whatever file its versions came from (before re-indexing
+        a new version of it). Chunks stored without a document key belong to their source file.
+        """
+        removed = {row_id for row_id, row in self.rows.items() if (row.get("document_key") or row.get("source_file")) == document_key}
+        if not removed:
+            return
+        for row_id in removed:
+            del self.rows[row_id]
+        for key in list(self.keys):
+            self.keys[key] = [p for p in self.keys[key] if p[0] not in removed]
+            if not self.keys[key]:
+                del self.keys[key]
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def load(self):
+        """Loads the index file if it exists. Returns True on success."""
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.rows = data["rows"]
+        self.keys = {key: [tuple(p) for p in postings] for key, postings in data["keys"].items()}
+        print(f"✅ Citation index loaded: {len(self.keys)} references over {len(self.rows)} chunks")
+        return True
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"keys": self.keys, "rows": self.rows}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    async def build_from_supabase(self, rest):
+        """Rebuilds the index from the documents table (used when no index file was shipped)."""
+        self.keys, self.rows = {}, {}
+        offset = 0
+        while True:
+            response = await rest.from_("documents").select(", ".join(ROW_FIELDS)).order("id").range(
+                offset, offset + CITATION_INDEX_PAGE_SIZE - 1
+            ).execute()
+            self.add_rows(response.data)
+            if len(response.data) < CITATION_INDEX_PAGE_SIZE:
+                break
+            offset += CITATION_INDEX_PAGE_SIZE
+        self.loaded = True
+        self.save()
+        print(f"✅ Citation index built from Supabase: {len(self.keys)} references over {len(self.rows)} chunks")
+
+    async def ensure_loaded(self, rest):
+        if self.loaded:
+            return
+        if not self.load():
+            await self.build_from_supabase(rest)
+
+    # ----------------------------
+    # Lookup
+    # ----------------------------
+    def lookup(self, question, top_k=CITATION_LOOKUP_TOP_K):
+        """
+        Chunks for the explicit citations in `question`, best first, or [] if the question
+        cites nothing (or nothing known).
+        """
+        # per citation, one score over all its keys: the chunk defining the cited § always comes first
+        # (the answer is in the provision itself), then chunks by the most specific key they match
+        # ("§ 52 písm. c" before a bare "§ 52"), then by how often / how prominently they cite it
+        matched = []
+        for section, subsection, letter in parse_citations(question):
+            keys = citation_keys(section, subsection, letter)
+            ranked = {}
+            for specificity, key in enumerate(reversed(keys)):
+                for row_id, score in self.keys.get(key, []):
+                    if row_id not in ranked or specificity > ranked[row_id][1]:
+                        ranked[row_id] = (defines_section(self.rows[row_id].get("content"), section), specificity, score, key)
+            postings = [(entry[3], row_id) for row_id, entry in sorted(ranked.items(), key=lambda item: item[1][:3], reverse=True)]
+            if postings:
+                matched.append(postings)
+
+        # round-robin over the cited references so every citation gets its best chunks in
+        results, seen = [], set()
+        for rank in range(max((len(postings) for postings in matched), default=0)):
+            for postings in matched:
+                if rank < len(postings) and postings[rank][1] not in seen:
+                    key, row_id = postings[rank]
+                    seen.add(row_id)
+                    results.append({**self.rows[row_id], "citation": key})
+        return results[:top_k]
+
+
+# Process-wide citation index
+citation_index = CitationIndex()
@@ -0,0 +1,111 @@
+# services/clients.py
+
+import os
+
+import httpx
+
+# Client configuration (override via environment variables)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+# keep-alive pool of the OpenAI clients, shared by all requests of the process
+# (Supabase has its own bounded HTTP/2 pool, see SupabaseData in services/supabase_client.py)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "120"))
+
+
+def pool_limits():
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+
+
+def supabase_headers(key=SUPABASE_KEY):
+    return {"apikey": key or "", "Authorization": f"Bearer {key}"}
+
+
+class Clients:
+    """
+    Process-wide API clients, each created on first use and then shared by every request and service.
+    Creating them is deferred (and the SDKs are imported lazily) so importing the app stays cheap;
+    the FastAPI lifespan creates them once at startup and closes their connection pools on shutdown.
+    """
+
+    def __init__(self):
+        self._openai = None
+        self._sync_openai = None
+        self._supabase_data = None
+        self._rest = None
+        self._supabase = None
+
+    @property
+    def openai(self):
+        """Async OpenAI client used by the API routes."""
+        if self._openai is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            self._openai = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=DefaultAsyncHttpxClient(limits=pool_limits()))
+        return self._openai
+
+    @property
+    def sync_openai(self):
+        """Blocking OpenAI client for the ingestion scripts; llm_scheduler does the retries."""
+        if self._sync_openai is None:
+            from openai import DefaultHttpxClient, OpenAI
+            self._sync_openai = OpenAI(api_key=OPENAI_API_KEY, max_retries=0,
+                                       http_client=DefaultHttpxClient(limits=pool_limits()))
+        return self._sync_openai
+
+    @property
+    def supabase_data(self):
+        """Async Supabase data access (services/supabase_client.py) used by the API routes."""
+        if self._supabase_data is None:
+            from services.supabase_client import SupabaseData
+            self._supabase_data = SupabaseData()
+        return self._supabase_data
+
+    @property
+    def rest(self):
+        """Async PostgREST query builder on the same HTTP/2 connection pool as supabase_data."""
+        if self._rest is None:
+            from postgrest import AsyncPostgrestClient
+            self._rest = AsyncPostgrestClient(f"{SUPABASE_URL}/rest/v1", headers=supabase_headers(),
+                                              http_client=self.supabase_data.session)
+        return self._rest
+
+    @property
+    def supabase(self):
+        """Blocking Supabase client used by the ingestion scripts."""
+        if self._supabase is None:
+            from supabase import create_client
+            self._supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return self._supabase
+
+    def open(self):
+        """Creates the clients the API needs (no network traffic, connections are opened on first use)."""
+        return self.openai, self.supabase_data, self.rest
+
+    async def aclose(self):
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+        if self._supabase_data is not None:
+            # also closes the pool of the PostgREST client
+            await self._supabase_data.aclose()
+            self._supabase_data = None
+            self._rest = None
+
+
+clients = Clients()
+
+
+# FastAPI dependencies (`Depends(get_openai)`), so routes receive the shared clients
+def get_openai():
+    return clients.openai
+
+
+def get_rest():
+    return clients.rest
+
+
+def get_supabase_data():
+    return clients.supabase_data
@@ -0,0 +1,111 @@
+# services/context_builder.py
+
+import json
+import os
+
+from services.telemetry import log
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional dependency (or no cached encoding offline), fall back to the character ratio
+    _ENCODING = None
+
+# Context configuration (override via environment variables)
+# sized for the full retrieval top-k (15 chunks of ~800 words after overlap trimming)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "24000"))
+# measured on the Czech corpus with the cl100k/o200k tokenizers; used when tiktoken is not installed
+CONTEXT_CHARS_PER_TOKEN = float(os.environ.get("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+CONTEXT_MIN_PARTIAL_TOKENS = 200   # a chunk crossing the budget is cut down only if at least this much still fits
+MIN_OVERLAP_WORDS = 20             # shorter shared spans between chunks are treated as coincidence
+MAX_OVERLAP_WORDS = 300            # chunk_fixed overlaps neighbouring chunks by 150 words
+
+
+# Upper bound for hard API limits (embedding batches, rate limiter): ~2 characters per token never undercounts Czech.
+def estimate_tokens(text: str) -> int:
+    return len(text) // 2 + 1
+
+
+# Realistic count for the prompt budget: the tokenizer if available, otherwise CONTEXT_CHARS_PER_TOKEN.
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return int(len(text) / CONTEXT_CHARS_PER_TOKEN) + 1
+
+
+def _shared_span(left, right):
+    """Length of the longest span (in words) that ends `left` and starts `right`, 0 below MIN_OVERLAP_WORDS."""
+    first = right[0] if right else None
+    for size in range(min(len(left), len(right), MAX_OVERLAP_WORDS), MIN_OVERLAP_WORDS - 1, -1):
+        # a single word comparison rules out almost every size before the slices are compared
+        if left[-size] == first and left[-size:] == right[:size]:
+            return size
+    return 0
+
+
+def trim_overlap(words, packed):
+    """
+    Removes from `words` the spans it shares with chunks already in the context (the overlap
+    chunk_fixed copies into neighbouring chunks). `packed` holds (words, " text ") of those chunks.
+    Returns None if nothing new is left.
+    """
+    text = " ".join(words)
+    for other, other_text in packed:
+        if f" {text} " in other_text:
+            return None
+        head = _shared_span(other, words)
+        if head:
+            words = words[head:]
+        tail = _shared_span(words, other)
+        if tail:
+            words = words[:-tail]
+        if len(words) < MIN_OVERLAP_WORDS:
+            return None
+        text = " ".join(words)
+    return words
+
+
+def build_context(knowledge_base, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Compact JSON of the retrieved chunks for the generation prompt.
+    Keeps only id, title and text of each row, drops text already present in a better ranked
+    chunk and packs chunks in the order retrieval ranked them until `token_budget` is used up.
+    """
+    entries, packed, used = [], [], 2   # 2 = the enclosing brackets
+    dropped, truncated = 0, False
+    for index, row in enumerate(knowledge_base):
+        text = row.get("content") or row.get("chunk_text") or ""
+        words = trim_overlap(text.split(), packed)
+        if not words:
+            continue
+
+        entry = {"id": row.get("id"), "title": row.get("title"), "content": " ".join(words)}
+        tokens = count_tokens(json.dumps(entry, ensure_ascii=False, separators=(",", ":"))) + 1
+        if used + tokens > token_budget:
+            content_tokens = count_tokens(entry["content"])
+            remaining = token_budget - used - (tokens - content_tokens)
+            if remaining < CONTEXT_MIN_PARTIAL_TOKENS:
+                dropped = len(knowledge_base) - index
+                break
+            keep = int(len(entry["content"]) * remaining / content_tokens)
+            entry["content"] = entry["content"][:keep].rsplit(" ", 1)[0] + " …"
+            tokens = count_tokens(json.dumps(entry, ensure_ascii=False, separators=(",", ":"))) + 1
+            truncated = True
+
+        entries.append(entry)
+        packed.append((words, f" {' '.join(words)} "))
+        used += tokens
+        if used >= token_budget:
+            dropped = len(knowledge_base) - index - 1
+            break
+
+    context = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+    if dropped or truncated:
+        log.warning(f"✂️ Context budget of {token_budget} tokens reached: {dropped} chunks dropped"
+                    f"{', last one truncated' if truncated else ''}")
+    # log-only figures: estimated from the length, the tokenizer is not run twice more per request
+    raw_tokens = int(len(str(knowledge_base)) / CONTEXT_CHARS_PER_TOKEN) + 1
+    context_tokens = int(len(context) / CONTEXT_CHARS_PER_TOKEN) + 1
+    log.info(f"🧩 Context: {len(entries)}/{len(knowledge_base)} chunks, ~{context_tokens} tokens "
+          f"(saved ~{max(raw_tokens - context_tokens, 0)} vs. raw rows)")
+    return context
@@ -0,0 +1,62 @@
+# services/cutoff.py
+
+import os
+
+from services.telemetry import log
+
+# Cutoff configuration (override via environment variables)
+# ADAPTIVE_CUTOFF=1 (default) sends only the clearly relevant part of the retrieved candidates to the LLM:
+# the list is cut at the largest score gap or where scores drop below a fraction of the best one
+ADAPTIVE_CUTOFF = os.environ.get("ADAPTIVE_CUTOFF", "1") == "1"
+ADAPTIVE_MIN_RESULTS = int(os.environ.get("ADAPTIVE_MIN_RESULTS", "2"))
+ADAPTIVE_RELATIVE_THRESHOLD = float(os.environ.get("ADAPTIVE_RELATIVE_THRESHOLD", "0.75"))
+# a drop between neighbours of at least this fraction of the best score counts as a gap
+ADAPTIVE_MIN_GAP = float(os.environ.get("ADAPTIVE_MIN_GAP", "0.1"))
+
+
+def score_key(results):
+    """
+    The one score a result list is ranked by: rrf_score (fused), similarity (vector) or bm25 (lexical).
+    Fused rows keep the similarity / bm25 of their source list, so rrf_score wins as soon as any row has it.
+    """
+    for key in ("rrf_score", "similarity", "bm25"):
+        if any(r.get(key) is not None for r in results):
+            return key
+    return None
+
+
+def relevance(row, key=None):
+    """Score of a retrieved row under `key` (default: the row's own best score), None if unscored."""
+    return row.get(key) if key else row.get(score_key([row]))
+
+
+def adaptive_cutoff(results, max_k=None, min_k=ADAPTIVE_MIN_RESULTS, relative=ADAPTIVE_RELATIVE_THRESHOLD,
+                    min_gap=ADAPTIVE_MIN_GAP, enabled=ADAPTIVE_CUTOFF):
+    """
+    Cuts a best-first result list where relevance falls off instead of at a fixed count:
+    before the first row scoring below `relative` × best, or at the largest gap between
+    neighbours (if it is at least `min_gap` × best), whichever comes first.
+    Keeps at least `min_k` and at most `max_k` rows. Fused (RRF) lists and lists with unscored rows
+    (citation hits) are only capped at `max_k`.
+    """
+    results = results[:max_k] if max_k else results
+    # never mix score scales: cosine similarities (~0.6) and RRF scores (~0.016) are not comparable.
+    # RRF scores only encode ranks (a row found by two lists scores ~2× the rest), so fused lists are not cut
+    key = score_key(results)
+    scores = [relevance(r, key) for r in results]
+    if not enabled or key == "rrf_score" or len(results) <= min_k or None in scores or scores[0] <= 0:
+        return results
+
+    best = scores[0]
+    cut = next((i for i, score in enumerate(scores) if score < best * relative), len(scores))
+
+    gaps = [(scores[i - 1] - scores[i], i) for i in range(min_k, cut)]
+    if gaps:
+        gap, index = max(gaps)
+        if gap >= best * min_gap:
+            cut = index
+
+    cut = max(cut, min_k)
+    if cut < len(results):
+        log.info(f"✂️ Adaptive cutoff: {cut}/{len(results)} results kept")
+    return results[:cut]
@@ -0,0 +1,211 @@
+# services/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+# Cache configuration (override via environment variables)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.environ.get("EMBEDDING_CACHE_DISK_ITEMS", "200000"))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before embedding and caching: NFC unicode form and collapsed whitespace.
+    Czech diacritics can arrive either precomposed or combined, both must map to the same key.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model, normalized text).
+    - memory tier: LRU dict bounded by `memory_items`
+    - disk tier: SQLite file bounded by `disk_items`, survives restarts and is shared
+      between the API and the ingestion scripts
+    Each tier has its own lock and SQLite I/O never runs under the memory lock, so memory
+    lookups from the event loop don't wait for a disk read, write or eviction in a worker thread.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, memory_items=EMBEDDING_CACHE_MEMORY_ITEMS, disk_items=EMBEDDING_CACHE_DISK_ITEMS):
+        self.path = path
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._db = None
+        self._disk_count = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    # ----------------------------
+    # Keys / serialization
+    # ----------------------------
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _to_blob(embedding):
+        return array("f", embedding).tobytes()
+
+    @staticmethod
+    def _from_blob(blob):
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    # ----------------------------
+    # Disk tier
+    # ----------------------------
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._disk_count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._db
+
+    def open(self):
+        """Opens the disk tier now instead of on the first lookup (startup warm-up)."""
+        with self._disk_lock:
+            self._connect()
+
+    def _evict_disk(self):
+        # Trim 10% below the bound so eviction doesn't run on every insert
+        excess = self._disk_count - int(self.disk_items * 0.9)
+        db = self._connect()
+        db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.disk_evictions += excess
+        self._disk_count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # ----------------------------
+    # Memory tier
+    # ----------------------------
+    def _remember(self, key, embedding):
+        # caller holds _memory_lock
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _recall(self, key):
+        # caller holds _memory_lock
+        embedding = self._memory.get(key)
+        if embedding is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+        return embedding
+
+    def lookup(self, model, text):
+        """
+        Memory-only lookup. Cheap enough to call directly from the event loop: it only takes
+        the memory lock, which is never held during SQLite I/O.
+        Returns None on a memory miss without counting it (the disk tier decides).
+        """
+        key = self.key(model, text)
+        with self._memory_lock:
+            return self._recall(key)
+
+    def get(self, model, text):
+        """Returns the cached embedding from memory or disk, or None."""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model, texts):
+        """Looks up several texts at once. Missing entries come back as None."""
+        keys = [self.key(model, t) for t in texts]
+        results = [None] * len(keys)
+        with self._memory_lock:
+            for i, key in enumerate(keys):
+                results[i] = self._recall(key)
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        if not missing:
+            return results
+
+        now = time.time()
+        found = {}
+        with self._disk_lock:
+            db = self._connect()
+            for i in missing:
+                row = db.execute("SELECT vector FROM embeddings WHERE key = ?", (keys[i],)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    continue
+                db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (now, keys[i]))
+                self.disk_hits += 1
+                found[i] = self._from_blob(row[0])
+            db.commit()
+
+        with self._memory_lock:
+            for i, embedding in found.items():
+                self._remember(keys[i], embedding)
+                results[i] = embedding
+        return results
+
+    def put(self, model, text, embedding):
+        self.put_many(model, [text], [embedding])
+
+    def put_many(self, model, texts, embeddings):
+        keys = [self.key(model, t) for t in texts]
+        with self._memory_lock:
+            for key, embedding in zip(keys, embeddings):
+                self._remember(key, embedding)
+
+        now = time.time()
+        with self._disk_lock:
+            db = self._connect()
+            for key, embedding in zip(keys, embeddings):
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (key, model, self._to_blob(embedding), now),
+                )
+                if cursor.rowcount:
+                    self._disk_count += 1
+                else:
+                    db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (now, key))
+            if self._disk_count > self.disk_items:
+                self._evict_disk()
+            db.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_items": len(self._memory),
+            "disk_items": self._disk_count,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Process-wide cache shared by the API routes and the ingestion scripts
+embedding_cache = EmbeddingCache()
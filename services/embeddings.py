@@ -2,9 +2,18 @@
 
 import os
 import re
-from openai import OpenAI
 import asyncio
 import json
+import time
+
+from services.clients import clients
+from services.context_builder import build_context, estimate_tokens
+from services.embedding_cache import embedding_cache, normalize_text
+from services.llm_scheduler import llm_scheduler
+from services.streaming import stream_answer_events
+from services.query_expansion import LOCAL_EXPANSION_MIN_CONFIDENCE, expand_locally, expansion_cache
+from services.single_flight import embedding_flights, expansion_flights, flight_key, generation_flights, stream_broadcaster
+from services.telemetry import record_usage, timed
 
 # Load API key from environment variable
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -46,29 +55,147 @@ query_expansion_instructions = """
     * Use **official legal terminology** wherever possible.
     * Focus only on **Czech labor law context** — ignore other countries’ laws.
     """
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def expand_user_query(text):
-     return client.responses.create(
-                    model="gpt-4.1-nano",
-                    input=[{"role": "user", "content": text}],
-                    instructions=query_expansion_instructions,
-                    stream=False
-                ).output_text
+# OpenAI clients come from the shared registry (services/clients.py): clients.openai serves the
+# API routes so that waiting on OpenAI never blocks the event loop; clients.sync_openai is kept for
+# the command line ingestion scripts and goes through the shared llm_scheduler, which does the retries.
+
+async def expand_user_query(text):
+    """
+    Turns the user question into a Czech search query.
+    Order: TTL cache → local glossary expander → gpt-4.1-nano (only when the glossary is not confident).
+    """
+    expanded = expansion_cache.get(text)
+    if expanded is not None:
+        return expanded
+    # identical questions arriving together share one expansion
+    return await expansion_flights.run(flight_key(text), lambda: _expand_user_query(text))
+
+async def _expand_user_query(text):
+    expanded, confidence = expand_locally(text)
+    if expanded is None or confidence < LOCAL_EXPANSION_MIN_CONFIDENCE:
+        response = await clients.openai.responses.create(
+                        model="gpt-4.1-nano",
+                        input=[{"role": "user", "content": text}],
+                        instructions=query_expansion_instructions,
+                        stream=False
+                    )
+        record_usage("gpt-4.1-nano", response.usage)
+        expanded = response.output_text
+
+    expansion_cache.put(text, expanded)
+    return expanded
 
 # Function to get embeddings for a given text
-def get_embedding(text: str, model="text-embedding-3-large"):
+async def get_embedding(text: str, model="text-embedding-3-large"):
     """
     Generate an embedding vector for the given input text using OpenAI embeddings API.
+    Results are served from the two-tier embedding cache when possible.
     """
-    response = client.embeddings.create(
+    text = normalize_text(text)
+    embedding = embedding_cache.lookup(model, text)
+    if embedding is not None:
+        return embedding
+
+    return await embedding_flights.run(flight_key(model, text), lambda: _get_embedding(text, model))
+
+async def _get_embedding(text, model):
+    # disk tier touches SQLite, keep it off the event loop
+    embedding = await asyncio.to_thread(embedding_cache.get, model, text)
+    if embedding is not None:
+        return embedding
+
+    response = await clients.openai.embeddings.create(
         model=model,
         input=text
     )
-    return response.data[0].embedding
+    record_usage(model, response.usage)
+    embedding = response.data[0].embedding
+    await asyncio.to_thread(embedding_cache.put, model, text, embedding)
+    return embedding
+
+def get_embedding_sync(text: str, model="text-embedding-3-large"):
+    """
+    Blocking variant of get_embedding for scripts that run outside the event loop.
+    """
+    text = normalize_text(text)
+    embedding = embedding_cache.get(model, text)
+    if embedding is not None:
+        return embedding
+
+    response = llm_scheduler.run(
+        lambda timeout: clients.sync_openai.embeddings.create(model=model, input=text, timeout=timeout),
+        tokens=estimate_tokens(text)
+    )
+    embedding = response.data[0].embedding
+    embedding_cache.put(model, text, embedding)
+    return embedding
+
+# OpenAI embeddings API limits: at most 2048 inputs and 300k tokens per request.
+# Tokens are estimated conservatively with estimate_tokens (~2 characters per token, see context_builder).
+EMBEDDING_BATCH_MAX_INPUTS = 2048
+EMBEDDING_BATCH_MAX_TOKENS = 250_000
+
+def embedding_batches(texts):
+    """Splits texts into consecutive batches that fit into one embeddings.create call."""
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= EMBEDDING_BATCH_MAX_INPUTS or batch_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def get_embeddings_sync(texts, model="text-embedding-3-large"):
+    """
+    Embeds many texts with as few multi-input embeddings.create calls as the API limits allow.
+    Texts already in the embedding cache are not sent. Returns embeddings in input order.
+    """
+    texts = [normalize_text(t) for t in texts]
+    embeddings = embedding_cache.get_many(model, texts)
+
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+    fresh = {}
+    for batch in embedding_batches(missing):
+        response = llm_scheduler.run(
+            lambda timeout: clients.sync_openai.embeddings.create(model=model, input=batch, timeout=timeout),
+            tokens=sum(estimate_tokens(t) for t in batch)
+        )
+        batch_embeddings = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        embedding_cache.put_many(model, batch, batch_embeddings)
+        fresh.update(zip(batch, batch_embeddings))
+
+    return [e if e is not None else fresh[t] for t, e in zip(texts, embeddings)]
+
+async def get_embeddings(texts, model="text-embedding-3-large"):
+    """
+    Async variant of get_embeddings_sync for the API routes: cached texts are not sent,
+    the rest is embedded with multi-input embeddings.create calls (batches run concurrently).
+    Returns embeddings in input order.
+    """
+    texts = [normalize_text(t) for t in texts]
+    embeddings = await asyncio.to_thread(embedding_cache.get_many, model, texts)
+
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+
+    async def embed_batch(batch):
+        response = await clients.openai.embeddings.create(model=model, input=batch)
+        record_usage(model, response.usage)
+        batch_embeddings = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        await asyncio.to_thread(embedding_cache.put_many, model, batch, batch_embeddings)
+        return zip(batch, batch_embeddings)
+
+    fresh = {}
+    for pairs in await asyncio.gather(*(embed_batch(batch) for batch in embedding_batches(missing))):
+        fresh.update(pairs)
+
+    return [e if e is not None else fresh[t] for t, e in zip(texts, embeddings)]
 
 def response_instructions(knowledge_base, additional_rules=None):
+    with timed("context"):
+        context = build_context(knowledge_base)
     return f"""
         ### 📌 Chatbot Instructions
 
@@ -93,59 +220,65 @@ def response_instructions(knowledge_base, additional_rules=None):
         ### **Sources**
 
         ```json
-        {knowledge_base}
+        {context}
         ```
     """
 
-def get_ai_response(knowledge_base, question):
-     return client.responses.create(
+def generation_key(knowledge_base, question):
+    """Same question over the same sources → same answer, generated once for concurrent requests."""
+    return flight_key(question, tuple(r.get("id") for r in knowledge_base))
+
+async def get_ai_response(knowledge_base, question):
+    return await generation_flights.run(
+        generation_key(knowledge_base, question),
+        lambda: _get_ai_response(knowledge_base, question)
+    )
+
+async def _get_ai_response(knowledge_base, question):
+    response = await clients.openai.responses.create(
                     model="gpt-4.1",
                     input=[{"role": "user", "content": question}],
                     instructions=response_instructions(knowledge_base),
                     stream=False
                 )
+    record_usage("gpt-4.1", response.usage)
+    return response
 
-async def stream_openai_response(knowledge_base, question):
+def stream_openai_response(knowledge_base, question, on_complete=None, timings=None):
+    """
+    Streams the answer as SSE events. `on_complete(text, sources)` is called once the
+    response is finished, e.g. to store the answer in the answer cache.
+    `timings` (dict, optional) receives time-to-first-token and total generation time.
+    Concurrent identical requests subscribe to one generation and receive the same events;
+    `on_complete` and `timings` are those of the request that started it.
+    """
+    return stream_broadcaster.subscribe(
+        generation_key(knowledge_base, question),
+        lambda: _stream_openai_response(knowledge_base, question, on_complete, timings)
+    )
+
+async def _stream_openai_response(knowledge_base, question, on_complete, timings):
     additional_rules = """
         8. Start uuid list with '$'. Example: $[9830219d-78bb-491b-9af0-7826e34878d2,886492ad-502a-443d-aef7-7559826f1309]
     """
-    response = client.responses.create(
+    started = time.perf_counter()
+    response = await clients.openai.responses.create(
                     model="gpt-4.1",
                     input=[{"role": "user", "content": question}],
                     instructions=response_instructions(knowledge_base, additional_rules),
                     stream=True
                 )
 
-    full_text = ""
-    last_sent_len = 0
-    post_dollar = None
-
-    for chunk in response:
-        if chunk.type == "response.output_text.delta":
-            delta = chunk.delta
-            full_text += delta
-
-            if '$' in full_text:
-                parts = full_text.split('$', 1)
-                content = parts[0]
-                post_dollar = parts[1]
-            else:
-                content = full_text
-                post_dollar = ""
-
-            new_content = content[last_sent_len:]
-            if new_content:
-                yield f"data: {json.dumps({'content': new_content})}\n\n"
-            last_sent_len = len(content)
-
-            await asyncio.sleep(0.02)
-        elif chunk.type == "response.completed":
-            if post_dollar:
-                used_ids = extract_source_ids_from_res(post_dollar)
-                if used_ids:
-                    sources = [{"id": r.get("id"), "title": r.get("title")} for r in knowledge_base if r.get("id") in used_ids]
-                    yield f"data: {json.dumps({'sources': sources})}\n\n"
-            yield "data: [DONE]\n\n"
+    async for event in stream_answer_events(response, knowledge_base, extract_source_ids_from_res,
+                                            on_complete=on_complete, started=started, timings=timings):
+        yield event
+
+async def replay_cached_answer(answer):
+    """Replays an answer from the answer cache with the same SSE events stream_openai_response emits."""
+    yield f"data: {json.dumps({'content': answer['text']})}\n\n"
+    if answer.get("sources"):
+        yield f"data: {json.dumps({'sources': answer['sources']})}\n\n"
+    yield "data: [DONE]\n\n"
 
 def extract_source_ids_from_res(res: str):
     lines = [line.strip() for line in res.strip().splitlines() if line.strip()]
@@ -0,0 +1,194 @@
+# services/lexical_index.py
+
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from services.query_expansion import fold
+
+# Lexical index configuration (override via environment variables)
+LEXICAL_INDEX_PATH = os.environ.get("LEXICAL_INDEX_PATH", os.path.join(".cache", "lexical_index.json"))
+LEXICAL_INDEX_PAGE_SIZE = 1000
+BM25_K1 = 1.2
+BM25_B = 0.75
+TAG_WEIGHT = 3  # a tag term counts like this many occurrences in the content
+
+# chunk fields kept in the index, same shape as the match_documents rows
+ROW_FIELDS = ("id", "title", "content", "tags", "method", "source_file", "document_key", "version")
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# folded Czech function words, they match almost every chunk and only add noise
+CZECH_STOPWORDS = {
+    "a", "aby", "ale", "ani", "az", "by", "byl", "byla", "bylo", "byt", "co", "do", "i", "jak", "jako", "je",
+    "jeho", "jej", "jeji", "jejich", "jen", "jestli", "jiz", "k", "kdy", "kdyz", "ke", "ktera", "ktere",
+    "ktery", "kteri", "na", "nebo", "nez", "o", "od", "po", "pod", "podle", "pokud", "pri", "pro", "proto",
+    "se", "si", "s", "ta", "tak", "take", "te", "tedy", "to", "tom", "tu", "ty", "u", "uz", "v", "ve", "z",
+    "za", "ze", "zda", "mam", "muze", "muzu", "jsem", "jsou", "ma",
+}
+
+# folded Czech inflection endings, longest first; stripping them maps "dovolene", "dovolenou",
+# "dovolenych" onto "dovolen" so declined forms in questions hit the forms in the law text
+CZECH_SUFFIXES = sorted({
+    "atech", "ich", "ych", "ymi", "ami", "emi", "ove", "ovi", "ech", "ach", "imu", "emu", "eho",
+    "iho", "ou", "em", "am", "im", "ym", "ho", "mu", "ce", "ku", "ky", "ka", "ek", "a", "e", "i", "o",
+    "u", "y",
+}, key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+
+def stem(token):
+    for suffix in CZECH_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    """Folded (no diacritics, lowercase), stemmed tokens of `text` without stopwords."""
+    return [stem(t) for t in TOKEN_PATTERN.findall(fold(text or "")) if t not in CZECH_STOPWORDS]
+
+
+def tag_terms(tags):
+    """Tags are stored as a list, a {"structural": [...], "semantic": [...]} dict or a '{a,b}' string."""
+    if isinstance(tags, dict):
+        return [t for values in tags.values() for t in (values or [])]
+    if isinstance(tags, str):
+        return [t.strip().strip('"') for t in tags.strip("{}").split(",") if t.strip()]
+    return list(tags or [])
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over the content and tags of the documents chunks.
+    Built by ingest_file from the rows it writes and persisted as JSON; the API loads it at
+    startup (or rebuilds it from the documents table when the file is missing).
+    Search needs no embedding, so it answers even while the embeddings API is slow.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        self.path = path
+        self.postings = {}   # term -> {chunk id: term frequency}
+        self.lengths = {}    # chunk id -> number of indexed terms
+        self.rows = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ----------------------------
+    # Building
+    # ----------------------------
+    def add_rows(self, rows):
+        for row in rows:
+            terms = Counter(tokenize(row.get("content")))
+            for term in tokenize(" ".join(tag_terms(row.get("tags")))):
+                terms[term] += TAG_WEIGHT
+            if not terms:
+                continue
+            if row["id"] in self.rows:
+                self.remove_ids({row["id"]})
+
+            self.rows[row["id"]] = {f: row.get(f) for f in ROW_FIELDS}
+            self.lengths[row["id"]] = sum(terms.values())
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[row["id"]] = tf
+
+    def remove_ids(self, removed):
+        for row_id in removed:
+            self.rows.pop(row_id, None)
+            self.lengths.pop(row_id, None)
+        for term in list(self.postings):
+            docs = self.postings[term]
+            for row_id in removed:
+                docs.pop(row_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def remove_document(self, document_key):
+        """
+        Drops all chunks of one document, whatever file its versions came from (before re-indexing
+        a new version of it). Chunks stored without a document key belong to their source file.
+        """
+        removed = {row_id for row_id, row in self.rows.items() if (row.get("document_key") or row.get("source_file")) == document_key}
+        if removed:
+            self.remove_ids(removed)
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def load(self):
+        """Loads the index file if it exists. Returns True on success."""
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.rows = data["rows"]
+        self.lengths = data["lengths"]
+        self.postings = data["postings"]
+        print(f"✅ Lexical index loaded: {len(self.postings)} terms over {len(self.rows)} chunks")
+        return True
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"postings": self.postings, "lengths": self.lengths, "rows": self.rows}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    async def build_from_supabase(self, rest):
+        """Rebuilds the index from the documents table (used when no index file was shipped)."""
+        self.postings, self.lengths, self.rows = {}, {}, {}
+        offset = 0
+        while True:
+            response = await rest.from_("documents").select(", ".join(ROW_FIELDS)).order("id").range(
+                offset, offset + LEXICAL_INDEX_PAGE_SIZE - 1
+            ).execute()
+            self.add_rows(response.data)
+            if len(response.data) < LEXICAL_INDEX_PAGE_SIZE:
+                break
+            offset += LEXICAL_INDEX_PAGE_SIZE
+        self.loaded = True
+        self.save()
+        print(f"✅ Lexical index built from Supabase: {len(self.postings)} terms over {len(self.rows)} chunks")
+
+    async def ensure_loaded(self, rest):
+        if self.loaded:
+            return
+        if not self.load():
+            await self.build_from_supabase(rest)
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+    def search(self, query, top_k):
+        """
+        Best `top_k` chunks for `query` by BM25, best first. Rows carry a "bm25" score;
+        chunks sharing no term with the query are not returned.
+        """
+        if not self.rows:
+            return []
+        total = len(self.rows)
+        average_length = sum(self.lengths.values()) / total
+
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for row_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[row_id] / average_length)
+                scores[row_id] = scores.get(row_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda s: s[1], reverse=True)[:top_k]
+        return [{**self.rows[row_id], "bm25": score} for row_id, score in best]
+
+
+# Process-wide lexical index
+lexical_index = LexicalIndex()
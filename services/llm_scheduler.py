@@ -0,0 +1,122 @@
+# services/llm_scheduler.py
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+# Scheduler configuration (override via environment variables)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+LLM_DEFAULT_TIMEOUT = float(os.environ.get("LLM_DEFAULT_TIMEOUT", "90"))
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at `per_minute / 60` units per second."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._available = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_after(error):
+    """Seconds the API asked us to wait (Retry-After header on 429), if any."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """
+    Process-wide scheduler for OpenAI chat/embedding calls made by the ingestion scripts.
+    - bounded concurrency (at most `max_concurrency` requests in flight)
+    - request and token budgets per minute (token buckets)
+    - retry with full-jitter exponential backoff on 429 / 5xx / timeouts / connection errors
+    - per-request timeouts passed down to the HTTP client, so a timed out call is actually aborted
+
+    `request` callables receive the timeout and must pass it to the OpenAI client, e.g.
+    `lambda timeout: client.chat.completions.create(..., timeout=timeout)`. Clients used here should
+    be created with max_retries=0 so retries are not done twice.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_retries=LLM_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def run(self, request, tokens=0, timeout=LLM_DEFAULT_TIMEOUT):
+        """Runs one API call in the calling thread under the concurrency and rate limits."""
+        attempt = 0
+        while True:
+            self._requests.acquire(1)
+            if tokens:
+                self._tokens.acquire(tokens)
+            with self._slots:
+                try:
+                    self.calls += 1
+                    return request(timeout)
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        self.failures += 1
+                        raise
+                    error = e
+
+            delay = retry_after(error) or random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+            self.retries += 1
+            print(f"⚠️ {type(error).__name__}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs `fn` on the shared pool. `fn` should make its API calls through `run`."""
+        return self._pool.submit(fn, *args, **kwargs)
+
+    def map(self, fn, items):
+        """
+        Fans `fn` out over `items` on the shared pool and returns results in input order.
+        Must not be nested: a mapped function calling map again can starve the pool.
+        """
+        futures = [self._pool.submit(fn, item) for item in items]
+        return [f.result() for f in futures]
+
+
+# Process-wide scheduler shared by all ingestion code
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,236 @@
+# services/local_index.py
+
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from services.clients import clients
+from services.quantization import EMBEDDING_STORAGE, QuantizedVectors, rescore
+
+# Local retrieval configuration (override via environment variables)
+# RETRIEVAL_BACKEND=local serves match_documents / match_knowledge_base from an in-process index,
+# RETRIEVAL_BACKEND=rpc (default) keeps using the Postgres RPCs.
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "rpc").lower()
+LOCAL_INDEX_DIR = os.environ.get("LOCAL_INDEX_DIR", ".cache/local_index")
+LOCAL_INDEX_REFRESH_INTERVAL = float(os.environ.get("LOCAL_INDEX_REFRESH_INTERVAL", "300"))
+LOCAL_INDEX_PAGE_SIZE = 500
+
+
+def parse_vector(value):
+    """pgvector columns come back from PostgREST as '[0.1,0.2,...]' strings."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    """
+    In-process mirror of a Supabase table with an embedding column.
+    - vectors: normalized float32 matrix, persisted as <dir>/<table>.npy and memory-mapped on load
+    - rows: the remaining columns, persisted as <dir>/<table>.json in the same order
+    - codes (EMBEDDING_STORAGE=int8 / binary): shortened, quantized vectors in <dir>/<table>.<storage>.npz,
+      searched first; only the shortlist is rescored with the full vectors
+    Search uses the same semantics as the match_* RPCs: cosine similarity above `threshold`,
+    best `top_k` first. The index is kept in sync with Supabase by an incremental refresh
+    that only downloads rows whose id is new or whose version changed.
+    `rest` is the async PostgREST client to sync from, None uses the shared one (services/clients.py).
+    """
+
+    def __init__(self, rest, table, columns, text_column="content", version_column="version",
+                 directory=LOCAL_INDEX_DIR, refresh_interval=LOCAL_INDEX_REFRESH_INTERVAL, storage=EMBEDDING_STORAGE):
+        self.rest = rest
+        self.table = table
+        self.columns = columns
+        self.text_column = text_column
+        self.version_column = version_column
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.storage = storage
+
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.rows = []
+        self.quantized = None  # first-pass codes when storage is int8 / binary
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task = None
+
+    @property
+    def matrix_path(self):
+        return os.path.join(self.directory, f"{self.table}.npy")
+
+    @property
+    def rows_path(self):
+        return os.path.join(self.directory, f"{self.table}.json")
+
+    @property
+    def codes_path(self):
+        return os.path.join(self.directory, f"{self.table}.{self.storage}.npz")
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ----------------------------
+    # Snapshot
+    # ----------------------------
+    def load_snapshot(self):
+        """Memory-maps the snapshot from disk if present. Returns True if rows were loaded."""
+        self._loaded = True
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.rows_path)):
+            return False
+        with open(self.rows_path, "r", encoding="utf-8") as f:
+            self.rows = json.load(f)
+        self.matrix = np.load(self.matrix_path, mmap_mode="r")
+        self.quantized = self.quantize(self.matrix, reuse_saved=True)
+        print(f"✅ Local index '{self.table}' loaded {len(self.rows)} rows from snapshot")
+        return True
+
+    def save_snapshot(self, matrix, rows):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_matrix = self.matrix_path + ".tmp.npy"
+        tmp_rows = self.rows_path + ".tmp"
+        np.save(tmp_matrix, matrix)
+        with open(tmp_rows, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_rows, self.rows_path)
+
+    def quantize(self, matrix, reuse_saved=False):
+        """First-pass codes for `matrix` (None for float32 storage), saved next to the snapshot."""
+        if self.storage == "float32":
+            return None
+        if reuse_saved and os.path.exists(self.codes_path):
+            quantized = QuantizedVectors.load(self.codes_path, self.storage)
+            if len(quantized) == len(matrix):
+                return quantized
+        quantized = QuantizedVectors.build(matrix, self.storage)
+        os.makedirs(self.directory, exist_ok=True)
+        quantized.save(self.codes_path)
+        return quantized
+
+    # ----------------------------
+    # Sync with Supabase
+    # ----------------------------
+    async def _fetch_remote_versions(self):
+        select = "id" if not self.version_column else f"id, {self.version_column}"
+        versions, offset = {}, 0
+        while True:
+            response = await (self.rest or clients.rest).from_(self.table).select(select).order("id").range(
+                offset, offset + LOCAL_INDEX_PAGE_SIZE - 1
+            ).execute()
+            for row in response.data:
+                versions[row["id"]] = row.get(self.version_column) if self.version_column else None
+            if len(response.data) < LOCAL_INDEX_PAGE_SIZE:
+                return versions
+            offset += LOCAL_INDEX_PAGE_SIZE
+
+    async def _fetch_rows(self, ids):
+        select = ", ".join(self.columns + ["embedding"])
+        rows = []
+        for i in range(0, len(ids), LOCAL_INDEX_PAGE_SIZE):
+            response = await (self.rest or clients.rest).from_(self.table).select(select).in_("id", ids[i:i + LOCAL_INDEX_PAGE_SIZE]).execute()
+            rows.extend(response.data)
+        return rows
+
+    async def refresh(self):
+        """Incrementally syncs the index with the table: adds new/changed rows, drops deleted ones."""
+        async with self._refresh_lock:
+            started = time.perf_counter()
+            if not self._loaded:
+                await asyncio.to_thread(self.load_snapshot)
+
+            remote = await self._fetch_remote_versions()
+            local = {row["id"]: row.get(self.version_column) if self.version_column else None for row in self.rows}
+
+            keep = [i for i, row in enumerate(self.rows) if row["id"] in remote and remote[row["id"]] == local[row["id"]]]
+            changed = [row_id for row_id, version in remote.items() if row_id not in local or local[row_id] != version]
+
+            if not changed and len(keep) == len(self.rows):
+                self._refreshed_at = time.monotonic()
+                return
+
+            fetched = await self._fetch_rows(changed) if changed else []
+            new_rows = [{c: r.get(c) for c in self.columns} for r in fetched]
+            new_vectors = [parse_vector(r["embedding"]) for r in fetched]
+
+            parts = []
+            if keep:
+                parts.append(np.asarray(self.matrix[keep], dtype=np.float32))
+            if new_vectors:
+                parts.append(normalize_rows(np.vstack(new_vectors)))
+            matrix = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+            rows = [self.rows[i] for i in keep] + new_rows
+
+            await asyncio.to_thread(self.save_snapshot, matrix, rows)
+            quantized = await asyncio.to_thread(self.quantize, matrix)
+            if quantized is not None:
+                # only shortlisted rows of the full vectors are read, keep them on disk
+                matrix = np.load(self.matrix_path, mmap_mode="r")
+            self.matrix, self.rows, self.quantized = matrix, rows, quantized
+            self._refreshed_at = time.monotonic()
+            print(f"🔄 Local index '{self.table}': +{len(new_rows)} / -{len(local) - len(keep)} rows "
+                  f"({len(rows)} total) in {time.perf_counter() - started:.2f}s")
+
+    async def ensure_ready(self):
+        """
+        Loads the snapshot on first use. If there is no snapshot the first caller waits for a full sync,
+        afterwards stale indexes are refreshed in the background without delaying searches.
+        """
+        if not self._loaded:
+            await asyncio.to_thread(self.load_snapshot)
+        if not self.rows:
+            await self.refresh()
+        elif time.monotonic() - self._refreshed_at > self.refresh_interval and (
+            self._refresh_task is None or self._refresh_task.done()
+        ):
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+    def search_batch(self, query_embeddings, top_k, threshold=None):
+        """
+        Top-k for several query vectors with one matrix product.
+        Returns one list of rows (with a 'similarity' key) per query.
+        """
+        if not self.rows:
+            return [[] for _ in query_embeddings]
+
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        if self.quantized is not None:
+            return [
+                self._matches(zip(indices, similarities), threshold)
+                for indices, similarities in rescore(self.matrix, queries, top_k, self.quantized)
+            ]
+
+        scores = queries @ self.matrix.T
+        k = min(top_k, scores.shape[1])
+
+        results = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append(self._matches(((i, row_scores[i]) for i in top), threshold))
+        return results
+
+    def _matches(self, ranked, threshold):
+        """Rows for best-first (index, similarity) pairs, stopping at `threshold`."""
+        matches = []
+        for i, similarity in ranked:
+            similarity = float(similarity)
+            if threshold is not None and similarity <= threshold:
+                break
+            matches.append({**self.rows[i], "similarity": similarity})
+        return matches
+
+    def search(self, query_embedding, top_k, threshold=None):
+        return self.search_batch([query_embedding], top_k, threshold)[0]
@@ -0,0 +1,149 @@
+# services/quantization.py
+
+import os
+import time
+
+import numpy as np
+
+# Compressed embedding storage (override via environment variables)
+# EMBEDDING_STORAGE=float32 (default) searches full vectors, int8 / binary search reduced-dimension
+# codes first and rescore the shortlist with the full vectors.
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE", "float32").lower()
+# text-embedding-3 vectors can be shortened by keeping the first dimensions and renormalizing,
+# which is what the API's `dimensions` parameter does, so no extra embedding call is needed
+EMBEDDING_SHORT_DIMENSIONS = int(os.environ.get("EMBEDDING_SHORT_DIMENSIONS", "256"))
+# the first pass keeps top_k × this many candidates for rescoring
+RESCORE_FACTOR = int(os.environ.get("RESCORE_FACTOR", "4"))
+RESCORE_MIN_CANDIDATES = 50
+
+SCAN_BLOCK_ROWS = 8192  # int8 codes are widened to float32 block by block, bounding the temporary memory
+
+# popcount of every byte value, for Hamming distances over packed bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def shorten(vectors, dimensions=EMBEDDING_SHORT_DIMENSIONS):
+    """First `dimensions` components of each vector, renormalized to unit length."""
+    short = np.asarray(vectors, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(short, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return short / norms
+
+
+class QuantizedVectors:
+    """
+    First-pass codes of a vector matrix: shortened to `dimensions`, then stored as
+    - int8: one byte per dimension, symmetric scale shared by the whole matrix
+    - binary: one bit per dimension (sign), compared by Hamming distance
+    A 3072-d float32 vector (12 KB) becomes 256 bytes (int8) or 32 bytes (binary) at 256 dimensions.
+    """
+
+    def __init__(self, storage, dimensions=EMBEDDING_SHORT_DIMENSIONS, codes=None, scale=1.0):
+        if storage not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantized storage '{storage}'")
+        self.storage = storage
+        self.dimensions = dimensions
+        self.codes = codes
+        self.scale = scale
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    @classmethod
+    def build(cls, matrix, storage, dimensions=EMBEDDING_SHORT_DIMENSIONS):
+        quantized = cls(storage, dimensions)
+        codes, scales = [], []
+        # the (possibly memory-mapped) full matrix is read once, block by block
+        for start in range(0, len(matrix), SCAN_BLOCK_ROWS):
+            short = shorten(matrix[start:start + SCAN_BLOCK_ROWS], dimensions)
+            if storage == "binary":
+                codes.append(np.packbits(short > 0, axis=1))
+            else:
+                codes.append(short)
+                scales.append(float(np.abs(short).max()) if short.size else 0.0)
+
+        if storage == "int8":
+            quantized.scale = (max(scales, default=0.0) or 1.0) / 127.0
+            codes = [np.round(block / quantized.scale).astype(np.int8) for block in codes]
+        width = dimensions if storage == "int8" else (dimensions + 7) // 8
+        quantized.codes = np.vstack(codes) if codes else np.zeros((0, width), dtype=np.int8 if storage == "int8" else np.uint8)
+        return quantized
+
+    def scores(self, query):
+        """First-pass score of every row for one full-dimension query vector (higher is better)."""
+        short = shorten(query, self.dimensions)
+        if self.storage == "binary":
+            bits = np.packbits(short > 0)
+            return -_POPCOUNT[np.bitwise_xor(self.codes, bits)].sum(axis=1, dtype=np.int32)
+        return np.concatenate([
+            self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32) @ short
+            for start in range(0, len(self.codes), SCAN_BLOCK_ROWS)
+        ]) if len(self.codes) else np.zeros(0, dtype=np.float32)
+
+    def candidates(self, query, count):
+        """Indices of the `count` best rows by first-pass score (unordered)."""
+        scores = self.scores(query)
+        count = min(count, len(scores))
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.argpartition(-scores, count - 1)[:count]
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, codes=self.codes, scale=self.scale, dimensions=self.dimensions)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, storage):
+        with np.load(path) as data:
+            return cls(storage, int(data["dimensions"]), data["codes"], float(data["scale"]))
+
+
+def rescore(matrix, queries, top_k, quantized, factor=RESCORE_FACTOR):
+    """
+    Two-stage search: shortlist from the quantized codes, exact cosine over the full vectors
+    of the shortlist only. Returns [(indices, similarities)] per query, best first.
+    """
+    results = []
+    for query in queries:
+        shortlist = np.sort(quantized.candidates(query, max(top_k * factor, RESCORE_MIN_CANDIDATES)))
+        similarities = np.asarray(matrix[shortlist], dtype=np.float32) @ query
+        order = np.argsort(-similarities)[:top_k]
+        results.append((shortlist[order], similarities[order]))
+    return results
+
+
+def recall_report(matrix, queries, top_k=10, storages=("int8", "binary"), dimensions=(128, 256, 512),
+                  factor=RESCORE_FACTOR):
+    """
+    recall@top_k of every storage / dimension combination against exact full-precision search,
+    for the first pass alone and after rescoring, with bytes per vector and search time per query.
+    `matrix` and `queries` must be L2-normalized.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    exact = [set(np.argsort(-(np.asarray(matrix) @ q))[:top_k]) for q in queries]
+
+    report = []
+    for storage in storages:
+        for dims in dimensions:
+            if dims > matrix.shape[1]:
+                continue
+            quantized = QuantizedVectors.build(matrix, storage, dims)
+
+            first_pass = [set(quantized.candidates(q, top_k)) for q in queries]
+            started = time.perf_counter()
+            rescored = rescore(matrix, queries, top_k, quantized, factor)
+            elapsed = (time.perf_counter() - started) / max(len(queries), 1)
+
+            report.append({
+                "storage": storage,
+                "dimensions": dims,
+                "bytes_per_vector": quantized.codes.shape[1],
+                "recall_first_pass": float(np.mean([len(e & f) / len(e) for e, f in zip(exact, first_pass)])),
+                "recall_rescored": float(np.mean([len(e & set(r[0])) / len(e) for e, r in zip(exact, rescored)])),
+                "ms_per_query": elapsed * 1000,
+            })
+    return report
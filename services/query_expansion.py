@@ -0,0 +1,191 @@
+# services/query_expansion.py
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Expansion configuration (override via environment variables)
+QUERY_EXPANSION_TTL = float(os.environ.get("QUERY_EXPANSION_TTL", "86400"))
+QUERY_EXPANSION_CACHE_ITEMS = int(os.environ.get("QUERY_EXPANSION_CACHE_ITEMS", "5000"))
+LOCAL_EXPANSION_MIN_CONFIDENCE = float(os.environ.get("LOCAL_EXPANSION_MIN_CONFIDENCE", "0.6"))
+
+# ----------------------------
+# Czech labour-law glossary
+# ----------------------------
+# trigger phrases (Czech or English, matched diacritics-insensitive by word prefix) → Czech search terms.
+# A word ending in "$" only matches itself: short or ambiguous stems are spelled out as whole words
+# ("plat" would also match "platí" and "platforma", "odbor" "odborná", "pay" "payment")
+LEGAL_GLOSSARY = [
+    (("dovolen", "vacation", "holiday", "annual leave", "paid leave"), "dovolená"),
+    (("tehotn", "pregnan"), "práce těhotné ženy ochrana zdraví pracovní podmínky"),
+    (("kojic", "breastfeed", "nursing mother"), "kojící zaměstnankyně přestávka na kojení"),
+    (("materskou", "materske", "materska", "maternity"), "mateřská dovolená"),
+    (("rodicovsk", "parental", "paternity"), "rodičovská dovolená"),
+    (("minimalni mzd", "minimalni plat", "minimum wage"), "minimální mzda"),
+    (("mzd", "wage", "salary", "salaries", "plat$", "platu$", "platy$", "platem$", "platov", "pay$", "paycheck"), "mzda plat odměňování"),
+    (("prescas", "overtime"), "práce přesčas příplatek"),
+    (("nocni prac", "night work", "night shift"), "noční práce"),
+    (("pracovni dob", "working hours", "working time", "work hours"), "pracovní doba"),
+    (("prestavk", "break$", "breaks$"), "přestávka v práci bezpečnostní přestávka"),
+    (("odpocin", "rest period"), "nepřetržitý odpočinek"),
+    (("zkusebni dob", "probation"), "zkušební doba"),
+    (("vypoved", "notice period", "resign", "dismiss", "fired$", "firing$", "terminat"), "výpověď výpovědní doba skončení pracovního poměru"),
+    (("okamzit", "immediate termination", "summary dismissal"), "okamžité zrušení pracovního poměru"),
+    (("odstupn", "severance"), "odstupné"),
+    (("pracovni pomer", "employment contract", "employment relationship"), "pracovní poměr pracovní smlouva"),
+    (("pracovni smlouv",), "pracovní smlouva náležitosti"),
+    (("dohoda o provedeni prace", "dpp$"), "dohoda o provedení práce"),
+    (("dohoda o pracovni cinnosti", "dpc$"), "dohoda o pracovní činnosti"),
+    (("dohod", "agreement"), "dohody o pracích konaných mimo pracovní poměr"),
+    (("pracovni uraz", "work injury", "workplace injury", "accident at work", "work accident"), "pracovní úraz odškodnění"),
+    (("nemoc z povolani", "occupational disease"), "nemoc z povolání"),
+    (("pracovni neschopnost", "sick", "illness", "nemoc$", "nemoci$", "nemocensk"), "dočasná pracovní neschopnost"),
+    (("bezpecnost", "safety"), "bezpečnost a ochrana zdraví při práci"),
+    (("prace na dalku", "remote work", "home office", "homeoffice", "work from home"), "práce na dálku"),
+    (("sdilene pracovni misto", "job sharing", "job share"), "sdílené pracovní místo"),
+    (("cestovni nahrad", "travel expense", "business trip", "pracovni cest"), "cestovní náhrady pracovní cesta"),
+    (("agentur", "agency work", "temp agency"), "agentura práce dočasné přidělení"),
+    (("diskrimin", "discrimination", "rovne zachazeni", "equal treatment"), "rovné zacházení zákaz diskriminace"),
+    (("odbor$", "odbory$", "odboru$", "odborech$", "odborov", "odborar", "trade union", "union$", "unions$"), "odborová organizace kolektivní vyjednávání"),
+    (("kolektivni smlouv", "collective agreement"), "kolektivní smlouva"),
+    (("pracoviste", "workplace"), "pracoviště"),
+    (("nahrada skody", "damages", "compensation for damage"), "náhrada škody odpovědnost"),
+    (("srazk", "wage deduction", "deduction from wage"), "srážky ze mzdy"),
+    (("mladistv", "minor$", "minors$", "under 18"), "zaměstnávání mladistvých"),
+    (("svatek", "public holiday"), "práce ve svátek příplatek"),
+    (("vikend", "weekend", "sobot", "nedele$", "nedeli$", "nedelni"), "práce v sobotu a v neděli příplatek"),
+    (("pohotovost", "on call", "on-call"), "pracovní pohotovost"),
+    (("prekazk", "absence", "leave of absence"), "překážky v práci"),
+    (("pracovni posudek", "potvrzeni o zamestnani", "reference letter"), "potvrzení o zaměstnání pracovní posudek"),
+]
+
+# words that are covered by the glossary context but add no search term on their own; matched as whole
+# words (inflections spelled out), so "lawyer" or "coder" are not mistaken for "law" or "code"
+NEUTRAL_TERMS = {
+    "employee", "employees", "employer", "employers", "worker", "workers", "staff", "job", "work", "working",
+    "days", "day", "hours", "weeks", "months", "law", "labour", "labor", "code", "czech", "right", "rights",
+    "entitled", "entitlement", "rules", "norms", "women", "woman",
+    "zamestnanec", "zamestnance", "zamestnanci", "zamestnancu", "zamestnancum", "zamestnancem", "zamestnany",
+    "zamestnana", "zamestnanych", "zamestnankyne", "zamestnankyni", "zamestnavatel", "zamestnavatele",
+    "zamestnavateli", "zamestnavatelem", "zamestnavatelu", "pracovnik", "pracovnika", "pracovniku", "pracovnici",
+    "pracovniky", "zakonik", "zakoniku", "zakonikem", "zakon", "zakona", "zakonu", "zakonem", "prace", "praci",
+    "pravo", "prava", "prav", "narok", "naroku", "narokem", "dni", "dnu", "dny", "hodin", "hodiny", "hodinach",
+    "pravidla", "pravidel", "zeny", "zena", "zen",
+}
+
+STOPWORDS = {
+    "hi", "hello", "hey", "please", "thanks", "thank", "you", "i", "me", "my", "we", "our", "a", "an", "the",
+    "is", "are", "was", "be", "do", "does", "did", "can", "could", "should", "would", "will", "have", "has",
+    "get", "gets", "what", "which", "who", "how", "many", "much", "when", "where", "why", "of", "for", "to",
+    "in", "on", "at", "by", "with", "and", "or", "if", "it", "there", "about", "under", "per", "any", "from",
+    "ahoj", "dobry", "den", "prosim", "dekuji", "jak", "jaky", "jaka", "jake", "kolik", "co", "kdy", "kde",
+    "proc", "je", "jsou", "ma", "mam", "muze", "muzu", "mohu", "se", "si", "na", "v", "ve", "z", "za", "o",
+    "do", "pro", "podle", "a", "i", "nebo", "k", "ke", "s", "u", "to", "ten", "ta", "kdyz", "rika",
+    "mi", "mne", "muj", "moje", "moji", "maji", "musi",
+}
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics (dovolená → dovolena)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+# trigger → [(word, whole word only)]
+_COMPILED_GLOSSARY = [
+    ([[(part.rstrip("$"), part.endswith("$")) for part in fold(trigger).split()] for trigger in triggers], terms)
+    for triggers, terms in LEGAL_GLOSSARY
+]
+
+
+def _matches(token, part):
+    word, whole = part
+    return token == word if whole else token.startswith(word)
+
+
+def expand_locally(question: str):
+    """
+    Builds the Czech search query from the glossary without calling the LLM.
+    Returns (query, confidence); confidence is the share of meaningful words in the question
+    that were recognised by the glossary (neutral words like "employee" count neither way).
+    query is None when nothing matched.
+    """
+    tokens = re.findall(r"\w+", fold(question))
+    content = [i for i, tok in enumerate(tokens) if tok not in STOPWORDS]
+    if not content:
+        return None, 0.0
+
+    covered = set()
+    terms = []
+    for trigger_list, expansion in _COMPILED_GLOSSARY:
+        for trigger in trigger_list:
+            for start in range(len(tokens) - len(trigger) + 1):
+                if all(_matches(tokens[start + j], part) for j, part in enumerate(trigger)):
+                    positions = range(start, start + len(trigger))
+                    # a longer phrase already claimed these words (e.g. "minimální mzda" vs "mzda")
+                    if all(p in covered for p in positions):
+                        continue
+                    covered.update(positions)
+                    if expansion not in terms:
+                        terms.append(expansion)
+
+    if not terms:
+        return None, 0.0
+
+    # neutral words add no evidence: they must not lift an accidental match over the confidence bar
+    content = [i for i in content if i in covered or tokens[i] not in NEUTRAL_TERMS]
+    confidence = sum(1 for i in content if i in covered) / len(content)
+    return " ".join(terms + ["zákoník práce"]), confidence
+
+
+class ExpansionCache:
+    """Bounded TTL cache of normalized question → expanded search query."""
+
+    def __init__(self, ttl=QUERY_EXPANSION_TTL, max_items=QUERY_EXPANSION_CACHE_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(question):
+        return " ".join(fold(question).split())
+
+    def get(self, question):
+        key = self.key(question)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, question, expanded):
+        key = self.key(question)
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, expanded)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Process-wide expansion cache
+expansion_cache = ExpansionCache()
@@ -0,0 +1,193 @@
+# services/retrieval.py
+
+import asyncio
+import os
+
+from services.cutoff import adaptive_cutoff  # re-exported for the routes
+from services.embedding_cache import normalize_text
+from services.embeddings import expand_user_query, get_embedding
+from services.lexical_index import lexical_index
+from services.supabase_client import match_documents, match_knowledge_base
+from services.telemetry import log
+
+# Retrieval configuration (override via environment variables)
+# FEDERATED_RETRIEVAL=1 searches documents and knowledge_base together and fuses the rankings
+FEDERATED_RETRIEVAL = os.environ.get("FEDERATED_RETRIEVAL", "0") == "1"
+# embedding and search of each store each get this much time, slower stores are dropped from the answer
+FEDERATED_STORE_BUDGET_MS = float(os.environ.get("FEDERATED_STORE_BUDGET_MS", "2000"))
+RRF_K = 60
+# SPECULATIVE_RETRIEVAL=1 searches the raw question while the query expansion is still running
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "0") == "1"
+# raw-question hits at or above this similarity are trusted and the expanded search is skipped
+SPECULATIVE_CONFIDENT_SIMILARITY = float(os.environ.get("SPECULATIVE_CONFIDENT_SIMILARITY", "0.55"))
+# once the raw hits are in, the expansion gets at most this much longer before the raw hits are returned alone
+SPECULATIVE_EXPANSION_TIMEOUT_MS = float(os.environ.get("SPECULATIVE_EXPANSION_TIMEOUT_MS", "3000"))
+# HYBRID_RETRIEVAL=1 searches documents with BM25 next to match_documents and fuses the rankings
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "0") == "1"
+# lexical-only fast mode: if the embedding is not back within this many ms, answer from BM25 alone (0 = always wait)
+LEXICAL_FALLBACK_MS = float(os.environ.get("LEXICAL_FALLBACK_MS", "0"))
+
+
+def best_similarity(results):
+    return max((r.get("similarity") or 0.0 for r in results), default=0.0)
+
+
+def merge_results(*result_sets, top_k):
+    """Union of several result lists by id, keeping the best similarity, best first."""
+    merged = {}
+    for results in result_sets:
+        for r in results:
+            current = merged.get(r.get("id"))
+            if current is None or (r.get("similarity") or 0.0) > (current.get("similarity") or 0.0):
+                merged[r.get("id")] = r
+    return sorted(merged.values(), key=lambda r: r.get("similarity") or 0.0, reverse=True)[:top_k]
+
+
+async def speculative_retrieve(question, top_k, threshold=0.1, model="text-embedding-3-small"):
+    """
+    Runs expand_user_query concurrently with an embed + match_documents of the raw question.
+    If the raw hits are confident the expansion is cancelled (the nano call itself stops unless another
+    request is waiting on the same expansion, see SingleFlight) and its search skipped, otherwise
+    the expanded query is searched too and both result sets are merged. If the expansion fails or
+    takes longer than SPECULATIVE_EXPANSION_TIMEOUT_MS, the raw hits are returned alone.
+    Returns (results, embedding): the raw question's embedding when its hits sufficed, else the expanded query's.
+    """
+    async def search(text):
+        if FEDERATED_RETRIEVAL:
+            results, embeddings = await federated_retrieve(text, top_k)
+            return embeddings.get(model), results
+        if HYBRID_RETRIEVAL:
+            results, embedding = await hybrid_retrieve(text, top_k, threshold=threshold, model=model)
+            return embedding, results
+        embedding = await get_embedding(text, model=model)
+        return embedding, await match_documents(embedding, top_k, threshold=threshold)
+
+    expansion = asyncio.create_task(expand_user_query(question))
+    # the task may be abandoned below, make sure its outcome is always retrieved
+    expansion.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    # cancels the expansion whenever it is not needed any more, also when the request is abandoned
+    try:
+        raw_embedding, raw = await search(question)
+
+        if raw and best_similarity(raw) >= SPECULATIVE_CONFIDENT_SIMILARITY:
+            log.info(f"⚡ Raw question hits are confident ({best_similarity(raw):.2f}), expanded search skipped")
+            return raw, raw_embedding
+
+        try:
+            expanded_query = await asyncio.wait_for(expansion, SPECULATIVE_EXPANSION_TIMEOUT_MS / 1000.0)
+        except asyncio.TimeoutError:
+            log.warning(f"⚠️ Query expansion slower than {SPECULATIVE_EXPANSION_TIMEOUT_MS:.0f} ms, answering from the raw question")
+            return raw, raw_embedding
+        except Exception as e:
+            log.warning(f"⚠️ Query expansion failed, answering from the raw question: {e}")
+            return raw, raw_embedding
+
+        expanded_embedding, expanded = await search(expanded_query)
+        return merge_results(expanded, raw, top_k=top_k), expanded_embedding
+    finally:
+        expansion.cancel()
+
+
+# ----------------------------
+# Hybrid lexical + vector retrieval
+# ----------------------------
+async def hybrid_retrieve(query, top_k, threshold=0.1, model="text-embedding-3-small",
+                          fallback_ms=LEXICAL_FALLBACK_MS):
+    """
+    BM25 over the local lexical index plus match_documents, fused with reciprocal-rank fusion.
+    The lexical search runs while the embedding is computed; if the embedding takes longer than
+    `fallback_ms` the BM25 hits are returned alone (the embedding still completes and is cached).
+    Returns (results, embedding), embedding is None when the lexical fast path answered.
+    """
+    embedding_task = asyncio.create_task(get_embedding(query, model=model))
+    # the task may be abandoned below, make sure its outcome is always retrieved
+    embedding_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    lexical = lexical_index.search(query, top_k)
+
+    if fallback_ms > 0 and lexical:
+        done, _ = await asyncio.wait({embedding_task}, timeout=fallback_ms / 1000.0)
+        if not done:
+            log.info(f"⚡ Embedding slower than {fallback_ms:.0f} ms, answered from the lexical index")
+            return lexical, None
+
+    embedding = await embedding_task
+    vector = await match_documents(embedding, top_k, threshold=threshold)
+    if not lexical:
+        return vector, embedding
+    # both lists are documents rows, the same chunk found by both is merged by its text
+    return reciprocal_rank_fusion([("documents", vector), ("documents", lexical)], top_k), embedding
+
+
+# ----------------------------
+# Federated retrieval
+# ----------------------------
+# Each store is searched with vectors of its own embedding model
+STORES = {
+    "documents": {
+        "model": "text-embedding-3-small",  # 1536-d
+        "text_column": "content",
+        "search": lambda embedding, top_k: match_documents(embedding, top_k, threshold=0.1),
+    },
+    "knowledge_base": {
+        "model": "text-embedding-3-large",  # 3072-d
+        "text_column": "chunk_text",
+        "search": lambda embedding, top_k: match_knowledge_base(embedding, top_k),
+    },
+}
+
+
+async def _within_budget(name, coroutine, budget_ms):
+    """Awaits `coroutine` for at most budget_ms, returns None (store dropped) on timeout or error."""
+    try:
+        return await asyncio.wait_for(coroutine, budget_ms / 1000.0)
+    except asyncio.TimeoutError:
+        log.warning(f"⏱️ Store '{name}' exceeded its {budget_ms:.0f} ms budget, dropped")
+    except Exception as e:
+        log.warning(f"⚠️ Store '{name}' failed, dropped: {e}")
+    return None
+
+
+async def embed_for_stores(query, stores=tuple(STORES), budget_ms=FEDERATED_STORE_BUDGET_MS):
+    """Embeds `query` once per distinct model of `stores`, all models in parallel. Returns {model: embedding}."""
+    models = list(dict.fromkeys(STORES[name]["model"] for name in stores))
+    embeddings = await asyncio.gather(*(
+        _within_budget(model, get_embedding(query, model=model), budget_ms) for model in models
+    ))
+    return {model: e for model, e in zip(models, embeddings) if e is not None}
+
+
+def reciprocal_rank_fusion(ranked_lists, top_k, k=RRF_K):
+    """
+    Fuses ranked result lists: score = Σ 1 / (k + rank). Rows with the same normalized text
+    (e.g. the same paragraph stored in both tables) are merged and their scores added.
+    """
+    fused = {}
+    for store, results in ranked_lists:
+        text_column = STORES[store]["text_column"]
+        for rank, row in enumerate(results, 1):
+            key = normalize_text(row.get(text_column) or row.get("content") or str(row.get("id"))).casefold()
+            if key not in fused:
+                fused[key] = {**row, "store": store, "rrf_score": 0.0}
+            fused[key]["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)[:top_k]
+
+
+async def federated_search(embeddings, top_k, stores=tuple(STORES), budget_ms=FEDERATED_STORE_BUDGET_MS):
+    """
+    Searches all `stores` concurrently (each with the embedding of its own model) and fuses the
+    rankings with reciprocal-rank fusion. Stores without an embedding or over budget are skipped.
+    """
+    names = [name for name in stores if STORES[name]["model"] in embeddings]
+    results = await asyncio.gather(*(
+        _within_budget(name, STORES[name]["search"](embeddings[STORES[name]["model"]], top_k), budget_ms)
+        for name in names
+    ))
+    return reciprocal_rank_fusion([(name, r) for name, r in zip(names, results) if r], top_k)
+
+
+async def federated_retrieve(query, top_k, stores=tuple(STORES), budget_ms=FEDERATED_STORE_BUDGET_MS):
+    """Embeds and searches `query` across all stores. Returns (fused results, {model: embedding})."""
+    embeddings = await embed_for_stores(query, stores, budget_ms)
+    return await federated_search(embeddings, top_k, stores, budget_ms), embeddings
@@ -0,0 +1,142 @@
+# services/single_flight.py
+
+import asyncio
+
+from services.embedding_cache import normalize_text
+
+
+def flight_key(*parts):
+    """Coalescing key: text parts are normalized and casefolded, other parts are used as they are."""
+    return tuple(normalize_text(p).casefold() if isinstance(p, str) else p for p in parts)
+
+
+class SingleFlight:
+    """
+    Runs concurrent identical async calls once: the first caller for a key starts the work,
+    callers arriving while it is in flight await the same result (or exception).
+    The work runs as its own task, so a waiter that disconnects does not cancel it for the others.
+    With `cancel_abandoned` the work is cancelled once its last waiter is cancelled, for calls
+    nobody else can use (a speculative query expansion whose raw hits were good enough).
+    """
+
+    def __init__(self, name, cancel_abandoned=False):
+        self.name = name
+        self.cancel_abandoned = cancel_abandoned
+        self._calls = {}
+        self._waiters = {}
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def run(self, key, factory):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._calls[key] = task
+            self.started += 1
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.cancel_abandoned and self._waiters[task] == 1 and not task.done():
+                # last waiter left: stop the work and let the next caller start a fresh one
+                if self._calls.get(key) is task:
+                    del self._calls[key]
+                task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # retrieve the outcome even if every waiter went away
+        task.cancelled() or task.exception()
+
+    def stats(self):
+        return {"started": self.started, "coalesced": self.coalesced, "abandoned": self.abandoned,
+                "in_flight": len(self._calls)}
+
+
+class _Broadcast:
+    """Events of one producer stream, kept so late subscribers can replay them from the start."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event=None):
+        if event is not None:
+            self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class StreamBroadcaster:
+    """
+    Single-flight for async generators: concurrent subscribers with the same key share one
+    producer and each receive every event it yields, from the first one on.
+    The producer runs to the end even if all subscribers disconnect.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._streams = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def subscribe(self, key, factory):
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _Broadcast()
+            self.started += 1
+            broadcast.task = asyncio.create_task(self._produce(key, broadcast, factory()))
+        else:
+            self.coalesced += 1
+
+        index = 0
+        while True:
+            while index < len(broadcast.events):
+                yield broadcast.events[index]
+                index += 1
+            if broadcast.done:
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+            await broadcast.wait()
+
+    async def _produce(self, key, broadcast, stream):
+        try:
+            async for event in stream:
+                broadcast.publish(event)
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            broadcast.publish()
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def stats(self):
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self._streams)}
+
+
+# Process-wide coalescing per pipeline stage
+expansion_flights = SingleFlight("expansion", cancel_abandoned=True)
+embedding_flights = SingleFlight("embedding")
+retrieval_flights = SingleFlight("retrieval")
+generation_flights = SingleFlight("generation")
+stream_broadcaster = StreamBroadcaster("stream")
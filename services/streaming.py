@@ -0,0 +1,144 @@
+# services/streaming.py
+
+import json
+import os
+import time
+
+from services.telemetry import log, record_stage, record_usage
+
+# Streaming configuration (override via environment variables)
+# Content is flushed as soon as STREAM_COALESCE_CHARS characters are buffered or (if set) the oldest
+# buffered character waited STREAM_COALESCE_MS. The defaults flush every delta immediately.
+STREAM_COALESCE_CHARS = int(os.environ.get("STREAM_COALESCE_CHARS", "0"))
+STREAM_COALESCE_MS = float(os.environ.get("STREAM_COALESCE_MS", "0"))
+
+SOURCES_SENTINEL = "$"
+
+
+def sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class SentinelSplitter:
+    """
+    Incremental state machine separating the answer from the source list that follows `sentinel`.
+    Each delta is looked at once: text that cannot be part of the sentinel is released immediately,
+    a trailing partial match is held back until the next delta decides it, and everything after
+    the sentinel goes to `tail`. Works when the sentinel arrives split across deltas.
+    """
+
+    def __init__(self, sentinel=SOURCES_SENTINEL):
+        self.sentinel = sentinel
+        self.found = False
+        self._pending = ""   # possible start of the sentinel, not released yet
+        self._tail = []
+
+    @property
+    def tail(self):
+        return "".join(self._tail)
+
+    def feed(self, delta):
+        """Returns the part of `delta` that is safe to emit as answer content."""
+        if self.found:
+            self._tail.append(delta)
+            return ""
+
+        text = self._pending + delta
+        self._pending = ""
+        index = text.find(self.sentinel)
+        if index != -1:
+            self.found = True
+            self._tail.append(text[index + len(self.sentinel):])
+            return text[:index]
+
+        # hold back the longest suffix that is a prefix of the sentinel
+        for size in range(min(len(self.sentinel) - 1, len(text)), 0, -1):
+            if self.sentinel.startswith(text[-size:]):
+                self._pending = text[-size:]
+                return text[:-size]
+        return text
+
+    def finish(self):
+        """Releases held-back text once the stream ended without completing the sentinel."""
+        pending, self._pending = self._pending, ""
+        return pending
+
+
+class Coalescer:
+    """Groups small deltas into fewer SSE events without a fixed sleep."""
+
+    def __init__(self, min_chars=STREAM_COALESCE_CHARS, max_delay_ms=STREAM_COALESCE_MS):
+        self.min_chars = min_chars
+        self.max_delay = max_delay_ms / 1000.0
+        self._parts = []
+        self._size = 0
+        self._since = None
+
+    def add(self, text):
+        """Buffers `text`, returns the buffered content if it should be flushed now, else None."""
+        if text:
+            if self._since is None:
+                self._since = time.perf_counter()
+            self._parts.append(text)
+            self._size += len(text)
+        if not self._size:
+            return None
+        if self._size >= self.min_chars or (self.max_delay and time.perf_counter() - self._since >= self.max_delay):
+            return self.flush()
+        return None
+
+    def flush(self):
+        text = "".join(self._parts)
+        self._parts, self._size, self._since = [], 0, None
+        return text
+
+
+async def stream_answer_events(response, knowledge_base, extract_source_ids, on_complete=None, started=None, timings=None):
+    """
+    Turns an async OpenAI Responses stream into SSE events:
+    {'content': ...} while the answer streams, {'sources': [...]} and [DONE] at the end.
+    Linear in the answer length. Fills `timings` (if given) with 'ttft' and 'total' in seconds,
+    measured from `started` (perf_counter), and calls `on_complete(text, sources)` when finished.
+    """
+    started = started if started is not None else time.perf_counter()
+    splitter = SentinelSplitter()
+    coalescer = Coalescer()
+    content = []
+    first_token_at = None
+
+    async for chunk in response:
+        if chunk.type == "response.output_text.delta":
+            flushed = coalescer.add(splitter.feed(chunk.delta))
+            if flushed:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                content.append(flushed)
+                yield sse({'content': flushed})
+        elif chunk.type == "response.completed":
+            response_data = getattr(chunk, "response", None)
+            record_usage(getattr(response_data, "model", None), getattr(response_data, "usage", None))
+            flushed = coalescer.add(splitter.finish()) or coalescer.flush()
+            if flushed:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                content.append(flushed)
+                yield sse({'content': flushed})
+
+            sources = []
+            used_ids = extract_source_ids(splitter.tail) if splitter.found else []
+            if used_ids:
+                sources = [{"id": r.get("id"), "title": r.get("title")} for r in knowledge_base if r.get("id") in used_ids]
+                yield sse({'sources': sources})
+
+            total = time.perf_counter() - started
+            ttft = first_token_at - started if first_token_at is not None else None
+            if timings is not None:
+                timings.update({"ttft": ttft, "total": total})
+            record_stage("generation", total)
+            if ttft is not None:
+                record_stage("ttft", ttft)
+                log.info(f"⏱️ Time to first token: {ttft * 1000:.0f} ms, total: {total * 1000:.0f} ms")
+
+            if on_complete:
+                on_complete("".join(content), sources)
+            yield "data: [DONE]\n\n"
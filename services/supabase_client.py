@@ -1,11 +1,17 @@
 # services/supabase_client.py
 
+import asyncio
 import os
-from supabase import create_client, Client
+import random
+import time
+from collections import deque
 
-# Load Supabase environment variables
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+import httpx
+
+from services.clients import SUPABASE_KEY, SUPABASE_URL, clients, supabase_headers
+from services.local_index import RETRIEVAL_BACKEND, LocalVectorIndex
+from services.single_flight import retrieval_flights
+from services.telemetry import log
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     print("❌ ERROR: Missing Supabase credentials in environment variables")
@@ -13,35 +19,282 @@ else:
     print("✅ DEBUG: Supabase URL:", SUPABASE_URL)
     print("✅ DEBUG: Supabase Key starts with:", SUPABASE_KEY[:6])
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Data-access configuration (override via environment variables)
+# bounded pool: HTTP/2 multiplexes concurrent requests over these few connections
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "10"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get("SUPABASE_KEEPALIVE_EXPIRY", "120"))
+# per-call timeouts: RPCs / small reads, bulk writes, and the default for everything else (paged index syncs)
+SUPABASE_READ_TIMEOUT = float(os.environ.get("SUPABASE_READ_TIMEOUT", "10"))
+SUPABASE_WRITE_TIMEOUT = float(os.environ.get("SUPABASE_WRITE_TIMEOUT", "60"))
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", "60"))
+SUPABASE_MAX_RETRIES = int(os.environ.get("SUPABASE_MAX_RETRIES", "2"))
+# reads still running after the p95 latency of their endpoint get a second, identical request (first answer wins)
+SUPABASE_HEDGE = os.environ.get("SUPABASE_HEDGE", "1") == "1"
+SUPABASE_HEDGE_AFTER_MS = float(os.environ.get("SUPABASE_HEDGE_AFTER_MS", "250"))  # until enough latencies are known
+SUPABASE_HEDGE_MIN_MS = float(os.environ.get("SUPABASE_HEDGE_MIN_MS", "20"))
+SUPABASE_WRITE_BATCH_SIZE = int(os.environ.get("SUPABASE_WRITE_BATCH_SIZE", "100"))
+SUPABASE_WRITE_CONCURRENCY = int(os.environ.get("SUPABASE_WRITE_CONCURRENCY", "4"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+
+
+class SupabaseError(Exception):
+    """PostgREST answered with an error status that retrying won't fix (or retries ran out)."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"Supabase {status_code}: {message}")
+        self.status_code = status_code
+
+
+def in_filter(values):
+    return "in.(" + ",".join(str(v) for v in values) + ")"
+
+
+class SupabaseData:
+    """
+    Async data access to the Supabase PostgREST API over one bounded, keep-alive HTTP/2 connection pool.
+    - reads (rpc / select / count): per-call timeout, retries with backoff on connection errors, 429 and 5xx,
+      and a hedged second request once a call runs past the p95 latency of its endpoint
+    - pipeline(): independent calls in flight at the same time, multiplexed over the pooled connections
+    - bulk writes (upsert / update_in / delete_in): batched, batches sent concurrently, retried
+      (all of them are idempotent) but never hedged
+    The API uses the process-wide instance (clients.supabase_data), scripts can open their own.
+    """
+
+    def __init__(self, url=SUPABASE_URL, key=SUPABASE_KEY, max_connections=SUPABASE_MAX_CONNECTIONS):
+        self.session = httpx.AsyncClient(
+            base_url=f"{url}/rest/v1",
+            headers={**supabase_headers(key), "Content-Type": "application/json"},
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY),
+            timeout=SUPABASE_TIMEOUT,
+        )
+        self._latencies = {}  # endpoint -> recent successful latencies (seconds)
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.session.aclose()
+
+    # ----------------------------
+    # Transport
+    # ----------------------------
+    async def _send(self, method, path, timeout, **kwargs):
+        """One logical request: retried with jittered exponential backoff on transient failures."""
+        for attempt in range(SUPABASE_MAX_RETRIES + 1):
+            self.requests += 1
+            started = time.perf_counter()
+            try:
+                response = await self.session.request(method, path, timeout=timeout, **kwargs)
+                if response.status_code != 429 and response.status_code < 500:
+                    if response.is_error:
+                        raise SupabaseError(response.status_code, response.text)
+                    self._latencies.setdefault(path, deque(maxlen=HEDGE_WINDOW)).append(time.perf_counter() - started)
+                    return response
+                error = SupabaseError(response.status_code, response.text)
+            except httpx.TimeoutException as e:
+                self.timeouts += 1
+                error = e
+            except httpx.TransportError as e:
+                error = e
+            if attempt == SUPABASE_MAX_RETRIES:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def hedge_delay(self, path):
+        """Seconds after which a read of `path` is hedged (p95 of its recent latencies), None = never."""
+        if not SUPABASE_HEDGE:
+            return None
+        samples = self._latencies.get(path)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return SUPABASE_HEDGE_AFTER_MS / 1000
+        p95 = sorted(samples)[int(0.95 * (len(samples) - 1))]
+        return max(SUPABASE_HEDGE_MIN_MS / 1000, p95)
+
+    async def _read(self, path, request):
+        """Runs `request` (a coroutine factory), hedged by a second copy if the first one is slow."""
+        delay = self.hedge_delay(path)
+        if delay is None:
+            return await request()
+
+        first = asyncio.create_task(request())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedged += 1
+                tasks.add(asyncio.create_task(request()))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # the slower copy is cancelled, which resets its HTTP/2 stream only
+            for task in tasks:
+                task.cancel()
+
+    # ----------------------------
+    # Reads
+    # ----------------------------
+    async def rpc(self, function, params, timeout=SUPABASE_READ_TIMEOUT):
+        """Calls a read-only Postgres function, returns its rows."""
+        path = f"/rpc/{function}"
+        response = await self._read(path, lambda: self._send("POST", path, timeout, json=params))
+        return response.json()
 
-def match_documents(query_embedding, top_k: int = 3, threshold=0.4):
+    async def select(self, table, timeout=SUPABASE_READ_TIMEOUT, **params):
+        """Rows of `table`, `params` are PostgREST query parameters (select=, order=, limit=, <column>=<op>.<value>)."""
+        path = f"/{table}"
+        response = await self._read(path, lambda: self._send("GET", path, timeout, params=params))
+        return response.json()
+
+    async def count(self, table, timeout=SUPABASE_READ_TIMEOUT, **params):
+        """Exact number of rows of `table` matching `params`."""
+        path = f"/{table}"
+        response = await self._read(path, lambda: self._send(
+            "GET", path, timeout, params={"select": "id", "limit": 1, **params}, headers={"Prefer": "count=exact"}
+        ))
+        return int(response.headers.get("content-range", "*/0").rsplit("/", 1)[1])
+
+    async def pipeline(self, *calls):
+        """Awaits independent calls together (they share the pooled connections), results in call order."""
+        return await asyncio.gather(*calls)
+
+    # ----------------------------
+    # Bulk writes
+    # ----------------------------
+    async def _batched(self, items, batch_size, send):
+        semaphore = asyncio.Semaphore(SUPABASE_WRITE_CONCURRENCY)
+
+        async def one(batch):
+            async with semaphore:
+                await send(batch)
+
+        await asyncio.gather(*(one(items[i:i + batch_size]) for i in range(0, len(items), batch_size)))
+        return len(items)
+
+    async def upsert(self, table, rows, on_conflict="id", batch_size=SUPABASE_WRITE_BATCH_SIZE, timeout=SUPABASE_WRITE_TIMEOUT):
+        """Inserts or merges `rows` by `on_conflict`, returns the number of rows written."""
+        headers = {"Prefer": "resolution=merge-duplicates,return=minimal"}
+        return await self._batched(rows, batch_size, lambda batch: self._send(
+            "POST", f"/{table}", timeout, params={"on_conflict": on_conflict}, json=batch, headers=headers
+        ))
+
+    async def update_in(self, table, values, column, keys, batch_size=SUPABASE_WRITE_BATCH_SIZE, timeout=SUPABASE_WRITE_TIMEOUT):
+        """Sets `values` on the rows whose `column` is in `keys`."""
+        return await self._batched(keys, batch_size, lambda batch: self._send(
+            "PATCH", f"/{table}", timeout, params={column: in_filter(batch)}, json=values, headers={"Prefer": "return=minimal"}
+        ))
+
+    async def delete_in(self, table, column, keys, batch_size=SUPABASE_WRITE_BATCH_SIZE, timeout=SUPABASE_WRITE_TIMEOUT):
+        """Deletes the rows whose `column` is in `keys`."""
+        return await self._batched(keys, batch_size, lambda batch: self._send(
+            "DELETE", f"/{table}", timeout, params={column: in_filter(batch)}, headers={"Prefer": "return=minimal"}
+        ))
+
+    def stats(self):
+        return {"requests": self.requests, "retries": self.retries, "timeouts": self.timeouts,
+                "hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+
+# The shared clients live in services/clients.py and are created on first use: `supabase_data`
+# (SupabaseData above, used by the API routes), `rest` (async PostgREST on the same connection pool,
+# used by the index syncs) and `supabase` (blocking, used by the ingestion scripts).
+def __getattr__(name):
+    if name == "supabase":
+        return clients.supabase
+    if name == "rest":
+        return clients.rest
+    if name == "supabase_data":
+        return clients.supabase_data
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Optional in-process mirrors of the vector tables (RETRIEVAL_BACKEND=local), they use the shared rest client
+documents_index = LocalVectorIndex(None, "documents", ["id", "title", "content", "tags", "method", "source_file", "version"])
+knowledge_base_index = LocalVectorIndex(None, "knowledge_base", ["id", "title", "chunk_text", "tags", "source_ref"],
+                                        text_column="chunk_text", version_column=None)
+
+async def search_local(index, query_embedding, top_k, threshold=None):
+    """Searches a local index, returns None when the RPC fallback should be used instead."""
+    try:
+        await index.ensure_ready()
+        if len(index):
+            return index.search(query_embedding, top_k, threshold)
+    except Exception as e:
+        log.warning(f"⚠️ Local index '{index.table}' failed, falling back to RPC: {e}")
+    return None
+
+async def match_documents(query_embedding, top_k: int = 3, threshold=0.4):
     """
     Calls the 'match_documents' Postgres function in Supabase to find similar chunks.
+    Concurrent identical searches share one call.
     """
-    response = supabase.rpc(
+    return await retrieval_flights.run(
+        ("match_documents", tuple(query_embedding), top_k, threshold),
+        lambda: _match_documents(query_embedding, top_k, threshold)
+    )
+
+async def _match_documents(query_embedding, top_k, threshold):
+    if RETRIEVAL_BACKEND == "local":
+        results = await search_local(documents_index, query_embedding, top_k, threshold)
+        if results is not None:
+            return results
+
+    return await clients.supabase_data.rpc(
         "match_documents",
         {
             "query_embedding": query_embedding,
             "match_count": top_k,
             "match_threshold": threshold # test with other values in future, when there will be more data in db
         }
-    ).execute()
+    )
+
+async def match_knowledge_base(embedding, limit):
+    return await retrieval_flights.run(
+        ("match_knowledge_base", tuple(embedding), limit),
+        lambda: _match_knowledge_base(embedding, limit)
+    )
 
-    if hasattr(response, "data"):
-        return response.data
-    else:
-        print("❌ ERROR: Supabase response did not contain 'data'. Full response:", response)
-        return []
+async def _match_knowledge_base(embedding, limit):
+    if RETRIEVAL_BACKEND == "local":
+        results = await search_local(knowledge_base_index, embedding, limit)
+        if results is not None:
+            return results
 
-def match_knowledge_base(embedding, limit):
-    response = supabase.rpc(
+    return await clients.supabase_data.rpc(
         "match_knowledge_base",
         {
             "query_embedding": embedding,
             "match_count": limit
         }
-    ).execute()
+    )
 
-    return response.data
+async def documents_fingerprint():
+    """
+    Cheap fingerprint of the documents table: total row count plus the highest version label.
+    Changes whenever ingest_file adds chunks or a new version of a document.
+    """
+    db = clients.supabase_data
+    total, latest = await db.pipeline(
+        db.count("documents"),
+        db.select("documents", select="version", version="not.is.null", order="version.desc", limit=1),
+    )
+    version = latest[0]["version"] if latest else None
+    return f"{total}:{version}"
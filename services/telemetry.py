@@ -0,0 +1,186 @@
+# services/telemetry.py
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Telemetry configuration (override via environment variables)
+# share of requests whose info-level log lines are written, warnings and errors are always logged
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# Prometheus histogram buckets in seconds, from local cache hits to slow generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# per-request state: {"timings": {stage: seconds}, "sampled": bool}
+_request = contextvars.ContextVar("request_telemetry", default=None)
+
+
+# ----------------------------
+# Metrics
+# ----------------------------
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Prometheus histogram, one series per combination of label values. Thread-safe."""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels, label_values, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels, label_values, ('le', '+Inf'))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {values[-1]}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Prometheus counter, one series per combination of label values. Thread-safe."""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for label_values, value in sorted(series.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return "\n".join(lines)
+
+
+def render_gauges(name, description, label, stats_by_name):
+    """Gauge family from stats() dicts: {name: {stat: value}} → name{label="...",stat="..."} value."""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+    for source, stats in stats_by_name.items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                lines.append(f"{name}{_labels((label, 'stat'), (source, stat))} {value}")
+    return "\n".join(lines)
+
+
+stage_seconds = Histogram("rag_stage_seconds", "Duration of one pipeline stage", ("stage",))
+request_seconds = Histogram("rag_request_seconds", "Duration of an HTTP request until its response starts", ("path", "status"))
+openai_tokens = Counter("rag_openai_tokens_total", "Tokens reported by OpenAI responses", ("model", "type"))
+
+
+# ----------------------------
+# Per-request timing
+# ----------------------------
+def start_request():
+    """Starts the telemetry context of one request (called by the HTTP middleware)."""
+    state = {"timings": {}, "sampled": random.random() < LOG_SAMPLE_RATE}
+    _request.set(state)
+    return state
+
+
+def record_stage(stage, seconds):
+    """Adds `seconds` to the stage timing of the current request and to the stage histogram."""
+    stage_seconds.observe(seconds, stage)
+    state = _request.get()
+    if state is not None:
+        state["timings"][stage] = state["timings"].get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def server_timing(state):
+    """Server-Timing header value for the stages of one request (durations in ms)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in state["timings"].items())
+
+
+def record_usage(model, usage):
+    """Counts the token usage of an OpenAI response (Responses or Embeddings API)."""
+    if usage is None:
+        return
+    for kind, attribute in (("input", "input_tokens"), ("output", "output_tokens"),
+                            ("input", "prompt_tokens"), ("output", "completion_tokens")):
+        value = getattr(usage, attribute, None)
+        if value:
+            openai_tokens.inc(value, model or "unknown", kind)
+
+
+# ----------------------------
+# Logging
+# ----------------------------
+class SampledFilter(logging.Filter):
+    """Lets info lines through only for sampled requests, warnings and errors always pass."""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        state = _request.get()
+        return state is None or state["sampled"]
+
+
+def _build_logger():
+    # records are formatted and written by a background thread, the request only enqueues them
+    logger = logging.getLogger("platform_backend")
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(SampledFilter())
+    logger.addHandler(handler)
+
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    atexit.register(listener.stop)
+    return logger
+
+
+log = _build_logger()
@@ -0,0 +1,84 @@
+# services/warmup.py
+
+import asyncio
+import os
+import time
+
+from services.answer_cache import answer_cache
+from services.citation_index import citation_index
+from services.clients import clients
+from services.embedding_cache import embedding_cache
+from services.lexical_index import lexical_index
+from services.local_index import RETRIEVAL_BACKEND
+from services.supabase_client import documents_fingerprint, documents_index, knowledge_base_index
+from services.telemetry import log
+
+# Warm-up configuration (override via environment variables)
+# WARMUP=1 also opens the OpenAI / Supabase connection pools, the embedding cache and the local index
+# before the instance reports ready; the § citation and BM25 indexes are always loaded
+WARMUP = os.environ.get("WARMUP", "0") == "1"
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "60"))
+
+
+class Readiness:
+    """Startup state reported by /ready: which steps finished, how long they took and which failed."""
+
+    def __init__(self):
+        self.ready = False
+        self.steps = {}
+
+    def report(self):
+        return {"status": "ready" if self.ready else "starting", "steps": self.steps}
+
+
+readiness = Readiness()
+
+
+async def _step(name, coroutine):
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(coroutine, WARMUP_TIMEOUT)
+        readiness.steps[name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        # a failed step never keeps the instance out of rotation, requests fall back to the slow path
+        readiness.steps[name] = {"ok": False, "error": str(e) or type(e).__name__}
+        log.warning(f"⚠️ Startup step '{name}' failed: {e}")
+
+
+async def _open_openai_pool():
+    # cheap authenticated GET: DNS, TCP and TLS are done before the first user request
+    await clients.openai.models.list()
+
+
+async def _open_supabase_pool():
+    # the corpus fingerprint also primes the answer cache version check
+    await answer_cache.ensure_fresh(documents_fingerprint)
+
+
+async def _load_local_indexes():
+    await asyncio.gather(documents_index.ensure_ready(), knowledge_base_index.ensure_ready())
+
+
+async def start(warmup=WARMUP):
+    """
+    Loads the § citation and BM25 lexical indexes (rebuilt from Supabase if no index file is present)
+    and, with `warmup`, primes connection pools, caches and the local index. Steps run concurrently;
+    readiness flips once all of them finished, whether they succeeded or not.
+    """
+    started = time.perf_counter()
+    steps = [
+        _step("citation_index", citation_index.ensure_loaded(clients.rest)),
+        _step("lexical_index", lexical_index.ensure_loaded(clients.rest)),
+    ]
+    if warmup:
+        steps += [
+            _step("openai_pool", _open_openai_pool()),
+            _step("supabase_pool", _open_supabase_pool()),
+            _step("embedding_cache", asyncio.to_thread(embedding_cache.open)),
+        ]
+        if RETRIEVAL_BACKEND == "local":
+            steps.append(_step("local_index", _load_local_indexes()))
+
+    await asyncio.gather(*steps)
+    readiness.ready = True
+    log.info(f"✅ Ready after {time.perf_counter() - started:.2f}s ({', '.join(readiness.steps)})")